@@ -1,16 +1,8 @@
 import pandas as pd
 import anc_MCI_configuration as conf
 
-# Import all necessary modules for the analysis
-modules = conf.get_modules()
-for m in modules:
-    if isinstance(m, tuple):
-        if len(m) == 3:
-            exec(f"from {m[0]} import {m[2]}")
-        else:
-            exec(f"import {m[0]} as {m[1]}")
-    else:
-        exec(f"import {m}")
+# Import all necessary modules for the analysis (each one is imported on first use)
+conf.import_modules(globals())
 
 # Disable warning
 pd.options.mode.chained_assignment = None
@@ -21,19 +13,16 @@ data_path = conf.get_path('data')
 results_path = conf.get_path('results')
 
 # Import data and plotting paramaters
-df = conf.get_data()
+df = conf.get_data(columns=conf.figure_columns['Figure_2'])
 plot_param = conf.get_plot()
 
-# Set plotting styles
-sns.set(style="whitegrid")
-sns.set_context("paper")
-
-sessions_df = conf.get_sessions_df()
+sessions_df = conf.get_sessions_df(flat_times=True)
+# sessions of each animal (in session order) as slices of the sorted table
+by_animal = conf.TrialIndex(sessions_df, ['animal'])
+# per-trial times of the sessions, memory-mapped (conf.split_times gives a view of each session)
+trial_times = conf.get_session_times()
 
 # Figure 2A ==================================================================
-figure2A_height = (60 / 25.4) * plot_param['sizeMult']
-figure2A_width = (90 / 25.4) * plot_param['sizeMult']
-
 Figure_2A = sessions_df[['animal', 'group', 'session', 'trials']].copy(deep=False)
 Figure_2A['session'] = Figure_2A['session'].astype(int)
 
@@ -42,162 +31,164 @@ mean_sessions = [Figure_2A[Figure_2A['trials'] > 0].groupby('animal')['session']
 zerotrials = []
 total = []
 for m in Figure_2A['animal'].unique():
-    zerotrials.append(len(Figure_2A[(Figure_2A['animal'] == m) & (Figure_2A['trials'] == 0)]))
-    total.append(len(Figure_2A[(Figure_2A['animal'] == m)]))
+    zerotrials.append(int((by_animal.get(m)['trials'] == 0).sum()))
+    total.append(len(by_animal.get(m)))
 
-f, ax = plt.subplots(1, 2, sharey='row',
-                     gridspec_kw={'width_ratios': [len(sessions_df.animal.unique()) - 8, 1]}, constrained_layout=True,
-                     figsize=(figure2A_width, figure2A_height))
 
-f.suptitle('Total trials per session across animals', fontsize=plot_param['titleFontSize'])
+def draw_2A(Figure_2A):
+    figure2A_height = (60 / 25.4) * plot_param['sizeMult']
+    figure2A_width = (90 / 25.4) * plot_param['sizeMult']
 
-g = sns.scatterplot(x='animal', y='trials', size='session', sizes=(10, 150),
-                legend=True, data=Figure_2A, color="black", alpha=.3, ax=ax[0])
+    f, ax = plt.subplots(1, 2, sharey='row',
+                         gridspec_kw={'width_ratios': [len(Figure_2A.animal.unique()) - 8, 1]}, constrained_layout=True,
+                         figsize=(figure2A_width, figure2A_height))
 
-handles, labels = ax[0].get_legend_handles_labels()
-handles = [handles[0], handles[-1]]
-labels = ["First", "Last"]
-g.legend(handles, labels, loc='upper right', ncol=1, borderpad=1.1,
-        labelspacing=1, frameon=True, title="Session", fontsize=8)
+    f.suptitle('Total trials per session across animals', fontsize=plot_param['titleFontSize'])
 
-sns.boxenplot(y='trials', data=Figure_2A, color="green", showfliers=False, ax=ax[1])
+    g = sns.scatterplot(x='animal', y='trials', size='session', sizes=(10, 150),
+                    legend=True, data=Figure_2A, color="black", alpha=.3, ax=ax[0])
 
-ax[0].set_ylabel(ylabel='Trials', fontsize=plot_param['labelFontSize'])
-ax[0].set_xlabel(xlabel=None)
-ax[0].tick_params(labelsize=8)
+    handles, labels = ax[0].get_legend_handles_labels()
+    handles = [handles[0], handles[-1]]
+    labels = ["First", "Last"]
+    g.legend(handles, labels, loc='upper right', ncol=1, borderpad=1.1,
+            labelspacing=1, frameon=True, title="Session", fontsize=8)
 
-ax[1].set(ylabel=None)
-ax[1].text(0, int(np.median(Figure_2A['trials'])), int(np.median(Figure_2A['trials'])),
-           color='white', fontsize=8, va="bottom", ha="center")
+    sns.boxenplot(y='trials', data=Figure_2A, color="green", showfliers=False, ax=ax[1])
 
-# Statistical testing on trial number across Sessions
-partial_df = sessions_df.copy(deep=False)
-partial_df = partial_df[['animal', 'session', 'duration', 'trials']]
-partial_df = partial_df.sort_values(by=['animal', 'session'])
+    ax[0].set_ylabel(ylabel='Trials', fontsize=plot_param['labelFontSize'])
+    ax[0].set_xlabel(xlabel=None)
+    ax[0].tick_params(labelsize=8)
 
-partial_df['absolute_session_number'] = 0
-for m in partial_df.animal.unique():
-    partial_df.loc[partial_df['animal'] == m, 'absolute_session_number'] = range(1, len(
-        partial_df[partial_df['animal'] == m]) + 1)
+    ax[1].set(ylabel=None)
+    ax[1].text(0, int(np.median(Figure_2A['trials'])), int(np.median(Figure_2A['trials'])),
+               color='white', fontsize=8, va="bottom", ha="center")
 
-STAT = pd.DataFrame()
-for a in Figure_2A['animal'].unique():
-    partial = pg.partial_corr(data=partial_df[partial_df['animal'] == a],
-                              x='trials', y='absolute_session_number', covar='duration')
 
-    t = pd.DataFrame(data={
-        'animal': a,
-        'trials/session': partial_df[partial_df['animal'] == a]['trials'].median().astype(int),
-        'total trials': partial_df[partial_df['animal'] == a]['trials'].sum().astype(int),
-        'p-value': partial['p-val'].values,
-        'r': partial['r'].values})
+conf.plot_figure('Figure_2A', draw_2A, Figure_2A)
 
-    STAT = pd.concat([STAT, t], ignore_index=True)
+# Statistical testing on trial number across Sessions
+partial_df = by_animal.data[['animal', 'session', 'duration', 'trials']]
+partial_df['absolute_session_number'] = by_animal.position('animal') + 1
+
+animals = Figure_2A['animal'].unique()
+partial = conf.partial_corr(partial_df, x='trials', y='absolute_session_number', covar='duration', by='animal')
+partial = partial.set_index('animal').loc[animals]
+resampled = conf.resample_corr(partial_df, x='trials', y='absolute_session_number', covar='duration', by='animal')
+resampled = resampled.set_index('animal').loc[animals]
+trials = partial_df.groupby('animal')['trials']
+
+STAT = pd.DataFrame(data={
+    'animal': animals,
+    'trials/session': trials.median().loc[animals].astype(int).values,
+    'total trials': trials.sum().loc[animals].astype(int).values,
+    'p-value': partial['p-val'].values,
+    'r': partial['r'].values,
+    'CI95%_boot': resampled['CI95%_boot'].values,
+    'p-perm': resampled['p-perm'].values})
 
 adjusted_p = multipletests(pvals=STAT['p-value'], alpha=0.05, method="b")
 STAT['adj_p'] = adjusted_p[1]
 STAT['adj_sig'] = adjusted_p[0]
 
 plot_name = 'Figure_2A'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
-
 if plot_param['savetable']:
     NAME = "{}{}{}".format(results_path, plot_name, '.csv')
-    STAT = STAT.reindex(columns=["animal", "trials/session", "total trials", "r", "p-value", "adj_p"])
+    STAT = STAT.reindex(columns=["animal", "trials/session", "total trials", "r", "p-value", "adj_p",
+                                 "CI95%_boot", "p-perm"])
     STAT['p-value'] = np.round(STAT['p-value'].astype(float), 5)
     STAT['adj_p'] = np.round(STAT['adj_p'].astype(float), 5)
+    STAT['p-perm'] = np.round(STAT['p-perm'].astype(float), 5)
     STAT['r'] = np.round(STAT['r'].astype(float), 5)
     STAT.to_csv(NAME, sep=';', decimal=".", index=False)
 
 # ==========================================================================================
 # FIGURE 2B - Trial times normalized to session end
-figure2B_height = (120 / 25.4) * plot_param['sizeMult']
-figure2B_width = (90 / 25.4) * plot_param['sizeMult']
-
 trial_sum = sessions_df.groupby(['group', 'animal'])['trials'].sum().reset_index()
 monkeys_list = sessions_df.animal.unique()
 
-fig = plt.figure(constrained_layout=True, figsize=(figure2B_width, figure2B_height))
-gs = plt.GridSpec(nrows=len(monkeys_list), ncols=1, figure=fig,
-                  height_ratios=[1] * len(monkeys_list), wspace=0, hspace=0)
-fig.suptitle('Trial times normalized to session end', fontsize=plot_param['titleFontSize'])
-
-ax = [None] * (len(monkeys_list) + 1)
-
-for i in range(len(monkeys_list)):
-    ax[i] = fig.add_subplot(gs[i, 0])
-    label = str('Animal ' + monkeys_list[i][0:3]) + ', sessions ' + str(
-        len(sessions_df[sessions_df['animal'] == monkeys_list[i]]['times']))
-
-    ax[i].eventplot(sessions_df[sessions_df['animal'] == monkeys_list[i]]['times'].to_numpy(),
-                    color="grey", lineoffsets=1, linelengths=1)
-    ax[i].set_xlim(0, 1)
-    ax[i].set_ylim(0, )
-    ax[i].set_ylabel(monkeys_list[i], rotation=0, fontsize=8)
-    ax[i].yaxis.set_label_position("right")
-    ax[i].set_xticks([])
-    ax[i].set_yticks([])
-    # ax[i].set_title(label, y=0.85, loc='right', fontsize=8)
-
-    if i == len(monkeys_list) - 1:
-        plt.xlabel('Session Proportion')
-        ax[i].set_xticks([0.2, 0.4, 0.6, 0.8])
-
-plot_name = 'Figure_2B'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
+
+def draw_2B(by_animal, trial_times, monkeys_list):
+    figure2B_height = (120 / 25.4) * plot_param['sizeMult']
+    figure2B_width = (90 / 25.4) * plot_param['sizeMult']
+
+    fig = plt.figure(constrained_layout=True, figsize=(figure2B_width, figure2B_height))
+    gs = plt.GridSpec(nrows=len(monkeys_list), ncols=1, figure=fig,
+                      height_ratios=[1] * len(monkeys_list), wspace=0, hspace=0)
+    fig.suptitle('Trial times normalized to session end', fontsize=plot_param['titleFontSize'])
+
+    ax = [None] * (len(monkeys_list) + 1)
+
+    for i in range(len(monkeys_list)):
+        ax[i] = fig.add_subplot(gs[i, 0])
+        label = str('Animal ' + monkeys_list[i][0:3]) + ', sessions ' + str(len(by_animal.get(monkeys_list[i])))
+
+        sessions = by_animal.order[by_animal.rows(monkeys_list[i])]
+        ax[i].eventplot(conf.split_times(trial_times, sessions), color="grey", lineoffsets=1, linelengths=1)
+        ax[i].set_xlim(0, 1)
+        ax[i].set_ylim(0, )
+        ax[i].set_ylabel(monkeys_list[i], rotation=0, fontsize=8)
+        ax[i].yaxis.set_label_position("right")
+        ax[i].set_xticks([])
+        ax[i].set_yticks([])
+        # ax[i].set_title(label, y=0.85, loc='right', fontsize=8)
+
+        if i == len(monkeys_list) - 1:
+            plt.xlabel('Session Proportion')
+            ax[i].set_xticks([0.2, 0.4, 0.6, 0.8])
+
+
+conf.plot_figure('Figure_2B', draw_2B, by_animal, trial_times, monkeys_list)
 
 if plot_param['savetable']:
     NAME = f"{results_path}Figure_2B.csv"
     STAT_2B = pd.DataFrame({
         "animal": monkeys_list,
-        "num_sessions": [len(sessions_df[sessions_df["animal"] == a]) for a in monkeys_list],
-        "total_trials": [sessions_df[sessions_df["animal"] == a]["trials"].sum() for a in monkeys_list]
+        "num_sessions": [len(by_animal.get(a)) for a in monkeys_list],
+        "total_trials": [by_animal.get(a)["trials"].sum() for a in monkeys_list]
     })
     STAT_2B.to_csv(NAME, sep=';', decimal='.', index=False)
 
 # ==========================================================================================
 # FIGURE 2C - Distribution of trial times with median
-figure2C_height = (60 / 25.4) * plot_param['sizeMult']
-figure2C_width = (90 / 25.4) * plot_param['sizeMult']
-
-f, ax = plt.subplots(figsize=(figure2C_width, figure2C_height), constrained_layout=True)
 plot_df = sessions_df.copy(deep=False)
 
-ax.hist(plot_df['medianTimes'], color="grey", bins=12)
-ax.set_xlabel('Session Proportion')
-ax.set_ylabel(ylabel=None)
-ax.set_yticks([])
-ax.set_xlim(0, 1)
-
 T = sessions_df.groupby(['animal'])['medianTimes'].median().reset_index()
 T['min'] = sessions_df.groupby(['animal'])['medianTimes'].min().to_list()
 T['max'] = sessions_df.groupby(['animal'])['medianTimes'].max().to_list()
 
-med = T['medianTimes'].median()
-label = 'N = ' + str(len(plot_df))
 
-ax.text(0.95, 10, label, color='black', fontsize=10, va="bottom", ha="right")
-ax.axvline(med, color='green', linestyle='--')
-ax.axvspan(xmin=T['medianTimes'].min(), xmax=T['medianTimes'].max(), facecolor='green', alpha=0.1)
-# ax.text(med + 0.03, 10, str(round(med, 2)), color='green', fontsize=10, va="bottom", ha="left")
-ax.set_xticks([0.2, 0.4, 0.6, 0.8])
-ax.set_yticks([5, 10])
+def draw_2C(plot_df, T):
+    figure2C_height = (60 / 25.4) * plot_param['sizeMult']
+    figure2C_width = (90 / 25.4) * plot_param['sizeMult']
+
+    f, ax = plt.subplots(figsize=(figure2C_width, figure2C_height), constrained_layout=True)
+
+    ax.hist(plot_df['medianTimes'], color="grey", bins=12)
+    ax.set_xlabel('Session Proportion')
+    ax.set_ylabel(ylabel=None)
+    ax.set_yticks([])
+    ax.set_xlim(0, 1)
+
+    med = T['medianTimes'].median()
+    label = 'N = ' + str(len(plot_df))
 
-ax.set_title('Median trials of all sessions', y=1.0, fontsize=plot_param['titleFontSize'])
+    ax.text(0.95, 10, label, color='black', fontsize=10, va="bottom", ha="right")
+    ax.axvline(med, color='green', linestyle='--')
+    ax.axvspan(xmin=T['medianTimes'].min(), xmax=T['medianTimes'].max(), facecolor='green', alpha=0.1)
+    # ax.text(med + 0.03, 10, str(round(med, 2)), color='green', fontsize=10, va="bottom", ha="left")
+    ax.set_xticks([0.2, 0.4, 0.6, 0.8])
+    ax.set_yticks([5, 10])
 
-STAT_partial = partial
+    ax.set_title('Median trials of all sessions', y=1.0, fontsize=plot_param['titleFontSize'])
+
+
+conf.plot_figure('Figure_2C', draw_2C, plot_df, T)
+
+STAT_partial = STAT
 STAT_tt = scipy.stats.ttest_1samp(plot_df[plot_df['medianTimes'] <= 1]['medianTimes'], 0.5)
 STAT_iqr = sessions_df.loc[:, 'trials'].quantile([.25, .5, .75]).to_list()
 
-plot_name = 'Figure_2C'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
-
 if plot_param['savetable']:
     # Compute per-animal medians, min, and max
     T = sessions_df.groupby('animal')['medianTimes'].median().reset_index()
@@ -234,6 +225,9 @@ Columns:
 - p-value: Uncorrected p-value for the partial correlation.
 - adj_p: Adjusted p-value after multiple comparison correction (Benjamini–Hochberg).
 - adj_sig: Boolean indicating whether the adjusted p-value is significant (True/False).
+- CI95%_boot: 95% bootstrap confidence interval of r (percentile, sessions resampled within the animal).
+- p-perm: Permutation p-value of r (Freedman–Lane: residuals of the session number on the duration
+  shuffled across the sessions of the animal).
 
 ====================================================================
 FIGURE 2B — Trial Times Normalized to Session End
@@ -269,4 +263,10 @@ Columns:
 
 --------------------------------------------------------------------
 Note: All numeric values are rounded to three or five decimal places as appropriate.
-""")
\ No newline at end of file
+""")
+
+# Draw the panels deferred by the render mode
+conf.render_figures()
+
+# Write the trace of the stages of this run (and its profile with MCI_PROFILE) in results/
+conf.write_trace('Figure_2')
@@ -1,16 +1,8 @@
 # import pandas as pd
 import anc_MCI_configuration as conf
 
-# Import all necessary modules for the analysis
-modules = conf.get_modules()
-for m in modules:
-    if isinstance(m, tuple):
-        if len(m) == 3:
-            exec(f"from {m[0]} import {m[2]}")
-        else:
-            exec(f"import {m[0]} as {m[1]}")
-    else:
-        exec(f"import {m}")
+# Import all necessary modules for the analysis (each one is imported on first use)
+conf.import_modules(globals())
 
 # Disable warning
 pd.options.mode.chained_assignment = None
@@ -20,11 +12,8 @@ plot_path = conf.get_path('plot')
 data_path = conf.get_path('data')
 results_path = conf.get_path('results')
 
-# Import data
-df = conf.get_data()
-
 # Import statistical results from Lauren Cassidy
-data_model, data_points, data_sessions = conf.get_bayes()
+data_model, data_points, data_sessions, model = conf.get_bayes(columns=conf.bayes_columns['Figure_3'], dense=True)
 
 # Import and plotting paramaters
 plot_param = conf.get_plot()
@@ -32,70 +21,76 @@ tasks_order = conf.get_analysis()['tasks_order']
 animal_list = data_points.sort_values(by=['group', 'animal'])['animal'].unique()
 data_model = data_model.sort_values(by=['selection', 'animal'], ascending=False)
 
-# Set plotting styles
-sns.set(style="whitegrid")
-sns.set_context("paper")
-
 # =============================================
 # FIGURE 3A
-Figure_3A_height = (180 / 25.4) * plot_param['sizeMult']
-Figure_3A_width = (180 / 25.4) * plot_param['sizeMult']
-
-fig, ax = plt.subplots(4, 4, sharex=False, sharey=True, figsize=(Figure_3A_width, Figure_3A_height))
-fig.suptitle('Choice proportions and model estimates (95% CI)', fontsize=plot_param['titleFontSize'])
-ax = ax.flatten()
-
 data_points['trial_norm'] = data_points['trial'] / max(data_points['trial'].values)
 size_thick = (10, 150)
 
-for i, a in enumerate(animal_list):
+# points and model estimates of each animal as slices of the tables (the points in task order), and the
+# credible intervals of each animal and task by indexing the dense model array
+data_points['x_order'] = data_points['selection'].map({'static': 0, 'dynamic': 1, 'pictures': 2})
+points_by_animal = conf.TrialIndex(data_points.sort_values(by='x_order', kind='stable'), ['animal'])
+model_by_animal = conf.TrialIndex(data_model, ['animal'])
+lower_CI = model['values'][:, :, model['stats'].index('lower_CI')]
+upper_CI = model['values'][:, :, model['stats'].index('upper_CI')]
 
-    plot_df = data_points[data_points['animal'] == a]
-    plot_df['x_order'] = plot_df['selection'].replace({'static': 0, 'dynamic': 1, 'pictures': 2})
-    plot_df = plot_df.sort_values(by='x_order').reset_index(drop=True)
+# panels in rows of 4, as many rows as needed for the animals
+n_cols = 4
+n_rows = int(np.ceil(len(animal_list) / n_cols))
 
-    g = sns.scatterplot(data=plot_df, alpha=0.5, palette='cubehelix', ax=ax[i],
-                            x='selection', y='estimate', hue='selection_position',
-                            size='trial_norm', sizes=(10, 150), legend= i/15 == 1)
 
-    g = sns.stripplot(x="selection", y="estimate", order=tasks_order, color='black',
-                      jitter=False, data=data_model[data_model['animal'] == a], ax=ax[i])
+def draw_3(points_by_animal, model_by_animal):
+    Figure_3A_height = (180 / 25.4) * plot_param['sizeMult'] * n_rows / 4
+    Figure_3A_width = (180 / 25.4) * plot_param['sizeMult']
+    last = len(animal_list) - 1
 
-    lCI = [data_model[(data_model['animal'] == a) & (data_model['selection'] == 'static')]['lower_CI'].values[0],
-           data_model[(data_model['animal'] == a) & (data_model['selection'] == 'dynamic')]['lower_CI'].values[0],
-           data_model[(data_model['animal'] == a) & (data_model['selection'] == 'pictures')]['lower_CI'].values[0]]
-    uCI = [data_model[(data_model['animal'] == a) & (data_model['selection'] == 'static')]['upper_CI'].values[0],
-           data_model[(data_model['animal'] == a) & (data_model['selection'] == 'dynamic')]['upper_CI'].values[0],
-           data_model[(data_model['animal'] == a) & (data_model['selection'] == 'pictures')]['upper_CI'].values[0]]
+    fig, ax = plt.subplots(n_rows, n_cols, sharex=False, sharey=True, squeeze=False,
+                           figsize=(Figure_3A_width, Figure_3A_height))
+    fig.suptitle('Choice proportions and model estimates (95% CI)', fontsize=plot_param['titleFontSize'])
+    ax = ax.flatten()
 
-    ax[i].vlines(x=[0, 1, 2], ymin=lCI, ymax=uCI, colors='black')
-    ax[i].axhline(y=0.33, color='grey', linestyle='--')
-    ax[i].set_xlabel(xlabel=None)
+    for i, a in enumerate(animal_list):
 
-    if i/15 == 1:
-        h, l = ax[i].get_legend_handles_labels()
-        handles = [h[0], h[2], h[1], h[3], h[4], h[5], h[9]]
-        labels = ['Button position', l[2], l[1], l[3], 'Trials', '< 100', '> 1000']
-        ax[i].get_legend().remove()
+        plot_df = points_by_animal.get(a).reset_index(drop=True)
 
-    ax[i].set_title(a)
-    ax[i].set_xlim([-0.5, 2.5])
-    g.set(xticklabels=[], xlabel=None)
-    g.set(xticklabels=[], xlabel=None, ylabel=None,
-          yticks=[0, 0.33, 0.66, 1], yticklabels=['0', '.33', '.66', '1'])
+        g = sns.scatterplot(data=plot_df, alpha=0.5, palette='cubehelix', ax=ax[i],
+                                x='selection', y='estimate', hue='selection_position',
+                                size='trial_norm', sizes=(10, 150), legend=i == last)
 
-ax[12].set_ylabel(ylabel='Proportion', fontsize=plot_param['labelFontSize'])
-ax[12].set_xticklabels(tasks_order, rotation=90, fontsize=plot_param['labelFontSize'])
-fig.tight_layout()
+        g = sns.stripplot(x="selection", y="estimate", order=tasks_order, color='black',
+                          jitter=False, data=model_by_animal.get(a), ax=ax[i])
 
-ax[15].legend(handles, labels, fontsize=plot_param['legendFontSize'],borderpad=0.2,
-             loc='lower right', bbox_to_anchor=(1.05, -0.70), ncol=2, fancybox=True, shadow=False)
+        # credible intervals of the animal in tasks_order (static, dynamic, pictures)
+        m = model['animals'].get_loc(a)
+        ax[i].vlines(x=[0, 1, 2], ymin=lower_CI[m], ymax=upper_CI[m], colors='black')
+        ax[i].axhline(y=0.33, color='grey', linestyle='--')
+        ax[i].set_xlabel(xlabel=None)
 
-plot_name = 'Figure_3'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
+        if i == last:
+            h, l = ax[i].get_legend_handles_labels()
+            handles = [h[0], h[2], h[1], h[3], h[4], h[5], h[9]]
+            labels = ['Button position', l[2], l[1], l[3], 'Trials', '< 100', '> 1000']
+            ax[i].get_legend().remove()
+
+        ax[i].set_title(a)
+        ax[i].set_xlim([-0.5, 2.5])
+        g.set(xticklabels=[], xlabel=None)
+        g.set(xticklabels=[], xlabel=None, ylabel=None,
+              yticks=[0, 0.33, 0.66, 1], yticklabels=['0', '.33', '.66', '1'])
+
+    for unused in ax[last + 1:]:
+        unused.axis('off')
+    ax[(n_rows - 1) * n_cols].set_ylabel(ylabel='Proportion', fontsize=plot_param['labelFontSize'])
+    ax[(n_rows - 1) * n_cols].set_xticklabels(tasks_order, rotation=90, fontsize=plot_param['labelFontSize'])
+    fig.tight_layout()
 
+    ax[last].legend(handles, labels, fontsize=plot_param['legendFontSize'],borderpad=0.2,
+                 loc='lower right', bbox_to_anchor=(1.05, -0.70), ncol=2, fancybox=True, shadow=False)
+
+
+conf.plot_figure('Figure_3', draw_3, points_by_animal, model_by_animal)
+
+plot_name = 'Figure_3'
 if plot_param['savetable']:
     NAME = "{}{}{}".format(results_path, plot_name, '.csv')
     data_model['order'] = data_model['selection'].apply(lambda x: {'static': 0, 'dynamic': 1, 'pictures': 3}[x])
@@ -130,4 +125,10 @@ around the posterior means.
 
 --------------------------------------------------------------------
 All numeric values are rounded to two or four decimal places as appropriate.
-""")
\ No newline at end of file
+""")
+
+# Draw the panels deferred by the render mode
+conf.render_figures()
+
+# Write the trace of the stages of this run (and its profile with MCI_PROFILE) in results/
+conf.write_trace('Figure_3')
@@ -1,16 +1,8 @@
 import pandas as pd
 import anc_MCI_configuration as conf
 
-# Import all necessary modules for the analysis
-modules = conf.get_modules()
-for m in modules:
-    if isinstance(m, tuple):
-        if len(m) == 3:
-            exec(f"from {m[0]} import {m[2]}")
-        else:
-            exec(f"import {m[0]} as {m[1]}")
-    else:
-        exec(f"import {m}")
+# Import all necessary modules for the analysis (each one is imported on first use)
+conf.import_modules(globals())
 
 # Disable warning
 pd.options.mode.chained_assignment = None
@@ -21,153 +13,152 @@ data_path = conf.get_path('data')
 results_path = conf.get_path('results')
 
 # Import data and plotting paramaters
-df = conf.get_data()
+df = conf.get_data(columns=conf.figure_columns['Figure_4'])
 plot_param = conf.get_plot()
 tasks_order = conf.get_analysis()['tasks_order']
 minSize = conf.get_analysis()['bout_minSize']
 
-# Set plotting styles
-sns.set(style="whitegrid")
-sns.set_context("paper")
-
 # ==============================================================
 # Load the curated dataframes
 static_df, dynamic_df, psycho_df = conf.get_performance()
 
 # ==============================================================
-figure4AB_height = (60 / 25.4) * plot_param['sizeMult']
-figure4AB_width = (180 / 25.4) * plot_param['sizeMult']
-
-f, ax = plt.subplots(1, 3, figsize=(figure4AB_width, figure4AB_height), sharey=False, constrained_layout=True)
-
-g = sns.pointplot(x='size', y='HR',
-                  estimator=np.median, errorbar=("pi", 50),
-                  data=static_df, color="black", ax=ax[0])
-
-g = sns.pointplot(x='size', y='chance', markers='', linestyles='--',
-                  data=static_df, color="grey", ax=ax[0])
-
-ax[0].set_xlabel(xlabel='Stimulus size', fontsize=plot_param['labelFontSize'])
-ax[0].set_ylabel(ylabel='Hit rate', fontsize=plot_param['labelFontSize'])
-ax[0].tick_params(labelsize=8)
-ax[0].set_ylim(0, 1)
-ax[0].set_title('Static Task', fontsize=plot_param['labelFontSize'])
-
-# Dynamic Task
-g = sns.lineplot(x='speed', y='wHR', size='size', sizes=(1, 5),
-                 legend=True, ci=None,
-                 data=dynamic_df, color="black", alpha=.25, ax=ax[1])
-
-ax[1].set_xlabel(xlabel='Speed', fontsize=plot_param['labelFontSize'])
-ax[1].set_ylabel(ylabel='Adjusted hit rate', fontsize=plot_param['labelFontSize'])
-ax[1].tick_params(labelsize=8)
-ax[1].set_ylim(0, 1)
-ax[1].set_xlim(10, 30)
-ax[1].set_title('Dynamic Task', fontsize=plot_param['labelFontSize'])
-
-handles, labels = ax[1].get_legend_handles_labels()
-handles = [handles[0], handles[-1]]
-labels = [labels[0], labels[-1]]
-g.legend(handles, labels, loc='lower center', ncol=2,
-         columnspacing=0.5, frameon=False, title="size", fontsize=8)
-
-# Hit Rate across sessions
-g = sns.lineplot(data=dynamic_df, ci=None, legend=True, color="black",
-                 x="session_relative", y="wHR", hue='speed', ax=ax[2])
-
-ax[2].set_ylim(0, 1)
-handles, labels = ax[2].get_legend_handles_labels()
-handles = [handles[0], handles[-1]]
-labels = [10, 30]
-g.legend(handles, labels, loc='lower center', ncol=2,
-         columnspacing=0.5, frameon=True, title="speed", fontsize=8)
-
-ax[2].set_xticks([1, 2, 3, 4, 5, 6])
-ax[2].set_xlim(1, 6)
-ax[2].tick_params(labelsize=8)
-ax[2].set_xlabel(xlabel='Session', fontsize=plot_param['labelFontSize'])
-ax[2].set_ylabel(ylabel=None)
-ax[2].set_yticklabels([])
-
-plot_name = 'Figure_4AB'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
+# Figure 4AB: hit rates of the static and dynamic tasks
+def draw_4AB(static_df, dynamic_df):
+    figure4AB_height = (60 / 25.4) * plot_param['sizeMult']
+    figure4AB_width = (180 / 25.4) * plot_param['sizeMult']
+
+    f, ax = plt.subplots(1, 3, figsize=(figure4AB_width, figure4AB_height), sharey=False, constrained_layout=True)
+
+    g = sns.pointplot(x='size', y='HR',
+                      estimator=np.median, errorbar=("pi", 50),
+                      data=static_df, color="black", ax=ax[0])
+
+    g = sns.pointplot(x='size', y='chance', markers='', linestyles='--',
+                      data=static_df, color="grey", ax=ax[0])
+
+    ax[0].set_xlabel(xlabel='Stimulus size', fontsize=plot_param['labelFontSize'])
+    ax[0].set_ylabel(ylabel='Hit rate', fontsize=plot_param['labelFontSize'])
+    ax[0].tick_params(labelsize=8)
+    ax[0].set_ylim(0, 1)
+    ax[0].set_title('Static Task', fontsize=plot_param['labelFontSize'])
+
+    # Dynamic Task
+    g = sns.lineplot(x='speed', y='wHR', size='size', sizes=(1, 5),
+                     legend=True, ci=None,
+                     data=dynamic_df, color="black", alpha=.25, ax=ax[1])
+
+    ax[1].set_xlabel(xlabel='Speed', fontsize=plot_param['labelFontSize'])
+    ax[1].set_ylabel(ylabel='Adjusted hit rate', fontsize=plot_param['labelFontSize'])
+    ax[1].tick_params(labelsize=8)
+    ax[1].set_ylim(0, 1)
+    ax[1].set_xlim(10, 30)
+    ax[1].set_title('Dynamic Task', fontsize=plot_param['labelFontSize'])
+
+    handles, labels = ax[1].get_legend_handles_labels()
+    handles = [handles[0], handles[-1]]
+    labels = [labels[0], labels[-1]]
+    g.legend(handles, labels, loc='lower center', ncol=2,
+             columnspacing=0.5, frameon=False, title="size", fontsize=8)
+
+    # Hit Rate across sessions
+    g = sns.lineplot(data=dynamic_df, ci=None, legend=True, color="black",
+                     x="session_relative", y="wHR", hue='speed', ax=ax[2])
+
+    ax[2].set_ylim(0, 1)
+    handles, labels = ax[2].get_legend_handles_labels()
+    handles = [handles[0], handles[-1]]
+    labels = [10, 30]
+    g.legend(handles, labels, loc='lower center', ncol=2,
+             columnspacing=0.5, frameon=True, title="speed", fontsize=8)
+
+    ax[2].set_xticks([1, 2, 3, 4, 5, 6])
+    ax[2].set_xlim(1, 6)
+    ax[2].tick_params(labelsize=8)
+    ax[2].set_xlabel(xlabel='Session', fontsize=plot_param['labelFontSize'])
+    ax[2].set_ylabel(ylabel=None)
+    ax[2].set_yticklabels([])
+
+
+conf.plot_figure('Figure_4AB', draw_4AB, static_df, dynamic_df)
 
 # ==============================================================
 # Figure 4B: adjusted hit rate vs size and speed
-figure4C_height = (45 / 25.4) * plot_param['sizeMult']
-figure4C_width = (120 / 25.4) * plot_param['sizeMult']
-
 wHR_df = dynamic_df.groupby(['size', 'speed'])['wHR'].mean().reset_index()
 wHR_df['speed'] = wHR_df['speed'].astype(int)
 
 # Create a pivot table with switched axes
 pivot_table = pd.pivot_table(wHR_df, values='wHR', index='size', columns='speed')
 
-# Create a figure with the desired width and aspect ratio
-fig, ax = plt.subplots(figsize=(figure4C_width, figure4C_height))
 
-# Create a 2D heatmap using seaborn
-g = sns.heatmap(pivot_table, cmap='magma', ax=ax,
-                cbar_kws={'aspect': 10, "pad": 0.01, 'label': 'Adjusted Hit Rate'})
-ax.set_yticklabels(ax.get_yticklabels(), rotation=0)
-ax.invert_yaxis()
+def draw_4C(pivot_table):
+    figure4C_height = (45 / 25.4) * plot_param['sizeMult']
+    figure4C_width = (120 / 25.4) * plot_param['sizeMult']
+
+    # Create a figure with the desired width and aspect ratio
+    fig, ax = plt.subplots(figsize=(figure4C_width, figure4C_height))
 
-ax.tick_params(labelsize=plot_param['tickFontSize'])
-ax.set_xlabel(xlabel='Speed', fontsize=plot_param['labelFontSize'])
-ax.set_ylabel(ylabel='Size', fontsize=plot_param['labelFontSize'])
-ax.set_title('Average adjusted hit rate across all animals', fontsize=plot_param['labelFontSize'])
+    # Create a 2D heatmap using seaborn
+    g = sns.heatmap(pivot_table, cmap='magma', ax=ax,
+                    cbar_kws={'aspect': 10, "pad": 0.01, 'label': 'Adjusted Hit Rate'})
+    ax.set_yticklabels(ax.get_yticklabels(), rotation=0)
+    ax.invert_yaxis()
 
-fig.tight_layout()
+    ax.tick_params(labelsize=plot_param['tickFontSize'])
+    ax.set_xlabel(xlabel='Speed', fontsize=plot_param['labelFontSize'])
+    ax.set_ylabel(ylabel='Size', fontsize=plot_param['labelFontSize'])
+    ax.set_title('Average adjusted hit rate across all animals', fontsize=plot_param['labelFontSize'])
 
-plot_name = 'Figure_4C'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
+    fig.tight_layout()
+
+
+conf.plot_figure('Figure_4C', draw_4C, pivot_table)
 
 # ==============================================================
 # Figure 4D: Scatter of size vs speed sweet spot distributions
-figure4D_height = (45 / 25.4) * plot_param['sizeMult']
-figure4D_width = (60 / 25.4) * plot_param['sizeMult']
-
-fig, ax = plt.subplots(figsize=(figure4D_width, figure4D_height), constrained_layout=True)
 counts = psycho_df.groupby(['speed', 'size']).size().reset_index(name='Count')
 counts['speed'] = counts['speed'].astype(int)
-g = sns.scatterplot(data=counts, x='speed', y='size', size='Count', sizes=(50, 350), ax=ax)
-
-ax.set_yticks([5, 7, 9])
-ax.set_xticks([10, 12, 14, 16, 18, 20])
-ax.set_xlim(9, 20)
-ax.set_ylim(4.1, 10)
-ax.tick_params(labelsize=plot_param['tickFontSize'])
-ax.set_xlabel(xlabel='Speed', fontsize=plot_param['labelFontSize'])
-ax.set_ylabel(ylabel='Size', fontsize=plot_param['labelFontSize'])
-# ax.set_title('Best adjusted hit rate', fontsize=plot_param['labelFontSize'])
-
-handles, labels = ax.get_legend_handles_labels()
-handles = [handles[0], handles[-1]]
-labels = [1, 7]
-g.legend(handles, labels, loc='upper right', ncol=1, borderpad=1.1,
-        labelspacing=1, frameon=True, title="Animals", fontsize=8)
-
-plot_name = 'Figure_4D'
-if plot_param['saveplot']:
-    NAME = "{}{}{}".format(plot_path, plot_name, '.pdf')
-    plt.savefig(NAME, format='pdf')
+
+# How often each size-speed combination is the sweet spot of an animal when its trials are resampled
+sweet_spots = conf.get_sweet_spots()
+
+
+def draw_4D(counts):
+    figure4D_height = (45 / 25.4) * plot_param['sizeMult']
+    figure4D_width = (60 / 25.4) * plot_param['sizeMult']
+
+    fig, ax = plt.subplots(figsize=(figure4D_width, figure4D_height), constrained_layout=True)
+    g = sns.scatterplot(data=counts, x='speed', y='size', size='Count', sizes=(50, 350), ax=ax)
+
+    ax.set_yticks([5, 7, 9])
+    ax.set_xticks([10, 12, 14, 16, 18, 20])
+    ax.set_xlim(9, 20)
+    ax.set_ylim(4.1, 10)
+    ax.tick_params(labelsize=plot_param['tickFontSize'])
+    ax.set_xlabel(xlabel='Speed', fontsize=plot_param['labelFontSize'])
+    ax.set_ylabel(ylabel='Size', fontsize=plot_param['labelFontSize'])
+    # ax.set_title('Best adjusted hit rate', fontsize=plot_param['labelFontSize'])
+
+    handles, labels = ax.get_legend_handles_labels()
+    handles = [handles[0], handles[-1]]
+    labels = [1, 7]
+    g.legend(handles, labels, loc='upper right', ncol=1, borderpad=1.1,
+            labelspacing=1, frameon=True, title="Animals", fontsize=8)
+
+
+conf.plot_figure('Figure_4D', draw_4D, counts)
 
 # ==============================================================
 # Statistics on dynamic task by animal
-STAT = pd.DataFrame()
-summary_df = dynamic_df.groupby(['group','animal','speed'])['wHR'].median().reset_index()
-total_df = dynamic_df.groupby('animal')['total'].sum().reset_index()
-for a in summary_df['animal'].unique():
-    t = pg.partial_corr(x='speed', y='wHR', data=summary_df[summary_df['animal'] == a])
-    t['animal'] = a
-    t['trials'] = total_df[total_df['animal']==a]['total'].values[0]
-    t['group'] = dynamic_df[dynamic_df['animal']==a]['group'].values[0]
+summary_df = dynamic_df.groupby(['group','animal','speed'], observed=True)['wHR'].median().reset_index()
+total_df = dynamic_df.groupby('animal', observed=True)['total'].sum()
+group_df = dynamic_df.drop_duplicates('animal').set_index('animal')['group']
 
-    STAT = pd.concat([STAT, t], ignore_index=True)
+STAT = conf.partial_corr(summary_df, x='speed', y='wHR', by='animal')
+resampled = conf.resample_corr(summary_df, x='speed', y='wHR', by='animal')
+STAT = STAT.merge(resampled[['animal', 'CI95%_boot', 'p-perm']], on='animal', how='left')
+STAT['trials'] = total_df.loc[STAT['animal']].values
+STAT['group'] = group_df.loc[STAT['animal']].values
 
 # Adjust statistics for multiple comparisons
 adjusted_p = multipletests(pvals=STAT['p-val'], alpha=0.05, method="b")
@@ -193,10 +184,12 @@ if plot_param['savetable']:
     # (animal-level statistics already computed in STAT)
     # --------------------------
     NAME = f"{results_path}Figure_4B.csv"
-    STAT = STAT.reindex(columns=["group", "animal", "r", "CI95%", "n", "trials", "p-val", "adj_p", "adj_sig"])
+    STAT = STAT.reindex(columns=["group", "animal", "r", "CI95%", "n", "trials", "p-val", "adj_p", "adj_sig",
+                                 "CI95%_boot", "p-perm"])
     STAT['r'] = np.round(STAT['r'], 2)
     STAT['adj_p'] = np.round(STAT['adj_p'], 4)
     STAT['p-val'] = np.round(STAT['p-val'], 4)
+    STAT['p-perm'] = np.round(STAT['p-perm'], 4)
     STAT.to_csv(NAME, sep=';', decimal='.', index=False)
 
     # --------------------------
@@ -216,6 +209,12 @@ if plot_param['savetable']:
     NAME = f"{results_path}Figure_4D.csv"
     table_4D.to_csv(NAME, sep=';', decimal='.', index=False)
 
+    table_4D_stability = sweet_spots.reindex(columns=['animal', 'size', 'speed', 'replicates', 'proportion',
+                                                      'observed'])
+    table_4D_stability['proportion'] = np.round(table_4D_stability['proportion'], 4)
+    NAME = f"{results_path}Figure_4D_stability.csv"
+    table_4D_stability.to_csv(NAME, sep=';', decimal='.', index=False)
+
 if plot_param['savetable']:
     desc_path = f"{results_path}Figure_4_description.txt"
     with open(desc_path, "w") as f:
@@ -251,6 +250,8 @@ Columns:
 - p-val: Unadjusted p‐value of the correlation.
 - adj_p: P-value adjusted for multiple comparisons (Benjamini–Hochberg).
 - adj_sig: Boolean indicating whether adj_p is below threshold.
+- CI95%_boot: 95% bootstrap confidence interval of r (percentile, speeds resampled within the animal).
+- p-perm: Permutation p-value of r (wHR shuffled across the speeds of the animal).
 
 --------------------------------------------------------------------
 FIGURE 4C — Mean adjusted hit rate for size × speed combinations
@@ -278,6 +279,26 @@ Columns:
 - size: Stimulus diameter (visual angle units).
 - Count: Number of animals for whom that size–speed combination was optimal.
 
+File: Figure_4D_stability.csv
+
+Each row indicates how often a size–speed combination is the optimal condition of an
+animal when the trials of every size–speed condition of the animal are resampled
+(binomial draws with the observed hit rate, n_boot replicates of conf.get_analysis()).
+
+Columns:
+- animal: Animal identifier.
+- size: Stimulus diameter (visual angle units).
+- speed: Target‐movement speed (visual angle units per second).
+- replicates: Number of replicates in which that combination was optimal.
+- proportion: Fraction of the replicates in which that combination was optimal.
+- observed: Boolean indicating whether it is the optimal combination of the observed data.
+
 --------------------------------------------------------------------
 Numeric values are rounded to three or four decimal places as appropriate.
-""")
\ No newline at end of file
+""")
+
+# Draw the panels deferred by the render mode
+conf.render_figures()
+
+# Write the trace of the stages of this run (and its profile with MCI_PROFILE) in results/
+conf.write_trace('Figure_4')
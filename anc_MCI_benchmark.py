@@ -0,0 +1,253 @@
+"""
+Benchmarks of the derivation functions of anc_MCI_configuration on synthetic exports.
+
+    python anc_MCI_benchmark.py run [--sizes 10k,1M,10M] [--output report.json]
+    python anc_MCI_benchmark.py compare old.json new.json
+
+- make_export
+    it writes a synthetic export with the columns, dtypes and structure of the real one (groups of
+    animals, sessions, bouts with set changes, sizes and speeds), plus the three Bayes tables
+
+- run
+    for every size (10k, 1M or 10M trials) it times each stage (get_data parsing and parquet reading,
+    get_sessions_df, get_performance, get_bayes, get_raw_data and the S2 bout binning, the partitioned
+    dataset) with its wall time, CPU time, peak memory (tracemalloc) and rows, and writes them in a JSON
+    report with the commit and the versions of python, pandas and numpy
+
+- compare
+    it prints the time and memory ratios of the stages of two reports (e.g. of two commits)
+
+The exports are written in benchmark_path/<size>/dataframes/ and kept for the next runs (same seed).
+
+author acalapai@dpz.eu
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import anc_MCI_configuration as conf
+
+benchmark_path = './benchmark/'
+
+sizes = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+
+# Animals of each group of the synthetic exports, and mean number of trials of an animal in a session
+animals = {'alwcla': ['al', 'cl'], 'bacnil': ['ba', 'ni'], 'casear': ['ca', 'ea'], 'curpin': ['cu', 'pi'],
+           'derelm': ['de', 'el'], 'natvin': ['na', 'vi'], 'heilotpansan': ['he', 'lo', 'pa', 'sa']}
+session_trials = 200
+
+
+def make_export(path, n_trials, seed=0):
+    # Synthetic export of about n_trials trials in path (MCI_export_*.csv and the Bayes tables): every animal
+    # of every group has the same sessions, its trials are split in bouts of about 20 trials, and the first
+    # trial of most bouts has a set change
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    n_sessions = max(1, round(n_trials / (sum(len(m) for m in animals.values()) * session_trials)))
+    blocks = pd.DataFrame([(g, s, a) for g, members in animals.items() for s in range(1, n_sessions + 1)
+                           for a in members], columns=['group', 'session', 'animal'])
+
+    # trials of every animal in every session, in recording order (group -> session -> animal)
+    n = rng.multinomial(n_trials, np.full(len(blocks), 1 / len(blocks)))
+    blocks, n = blocks[n > 0].reset_index(drop=True), n[n > 0]
+    block = np.repeat(np.arange(len(blocks)), n)
+    first = np.r_[0, np.cumsum(n)[:-1]]
+    session_end = rng.integers(60, 120, len(blocks)) * 60_000_000
+    u = rng.random(n_trials)
+    trial_start = (u[np.lexsort((u, block))] * session_end[block]).astype(np.int64)
+
+    # bouts of about 20 trials, numbered in each session of an animal
+    new_bout = rng.random(n_trials) < 0.05
+    new_bout[first] = True
+    bout = np.cumsum(new_bout)
+    bout -= np.repeat(bout[first], n)
+    codes, uniques = pd.factorize(block * (bout.max(initial=0) + 1) + bout)
+    labels = (blocks['animal'] + blocks['session'].astype(str)).to_numpy()[uniques // (bout.max(initial=0) + 1)]
+    bout_ID = pd.Categorical.from_codes(codes, labels + 'b' + (uniques % (bout.max(initial=0) + 1)).astype(str))
+
+    selection = rng.choice(['static', 'dynamic', 'pictures'], n_trials, p=[.4, .4, .2])
+    size = rng.integers(5, 11, n_trials)
+    hit = rng.random(n_trials) < conf.chance_level(size) / 100 + 0.4
+    version = np.where(blocks['group'].isin(conf.version_rules['v02']), 'v02', 'v04')
+    date = (pd.Timestamp('2022-01-01') + pd.to_timedelta(blocks['session'] - 1, 'D')).dt.strftime('%Y-%m-%d')
+
+    export = pd.DataFrame(data={
+        'group': pd.Categorical(blocks['group'].to_numpy()[block]),
+        'version': pd.Categorical(version[block]),
+        'manual_label': pd.Categorical((blocks['animal'] + '_' + blocks['group'].str[:3]).to_numpy()[block]),
+        'session_relative': blocks['session'].to_numpy()[block],
+        'date': pd.Categorical(date.to_numpy()[block]),
+        'trial': np.arange(n_trials) - np.repeat(first, n) + 1,
+        'trial_start': trial_start,
+        'session_end': session_end[block],
+        'selection': selection,
+        'outcome': np.where(selection == 'pictures', 'picture', np.where(hit, 'hit', 'miss')),
+        'size': size,
+        'speed': rng.integers(10, 31, n_trials),
+        'bout_ID': bout_ID,
+        'setChange_flag': (new_bout & (rng.random(n_trials) < 0.7)).astype(int),
+        'selection_xpos': rng.choice([-8, 0, 8], n_trials)})
+    export.to_csv(os.path.join(path, 'MCI_export_20230101.csv'), index=False, decimal=',')
+
+    # Bayes tables: one estimate per animal and task, per animal, task and position, per animal, task and session
+    tasks = conf.tasks_order
+    labels = [(g, a + '_' + g[:3]) for g, members in animals.items() for a in members]
+    model = pd.DataFrame([(a, t) for _, a in labels for t in tasks], columns=['animal', 'selection'])
+    model['estimate'] = rng.random(len(model))
+    model['sd'] = rng.random(len(model)) / 10
+    model['lower_CI'] = model['estimate'] - 2 * model['sd']
+    model['upper_CI'] = model['estimate'] + 2 * model['sd']
+    model.to_csv(os.path.join(path, 'MCI_BayesModel_LC_20230602.csv'), sep=';', decimal=',', index=False)
+
+    points = pd.DataFrame([(g, a, t, p) for g, a in labels for t in tasks for p in ['left', 'centre', 'right']],
+                          columns=['group', 'animal', 'selection', 'selection_position'])
+    points['estimate'] = rng.random(len(points))
+    points['trial'] = rng.integers(50, 1500, len(points))
+    points.to_csv(os.path.join(path, 'MCI_BayesPoints_LC_20230602.csv'), sep=';', decimal=',', index=False)
+
+    sessions = pd.DataFrame([(a, t, s) for _, a in labels for t in tasks for s in range(1, n_sessions + 1)],
+                            columns=['animal', 'selection', 'session'])
+    sessions['estimate'] = rng.random(len(sessions))
+    sessions['sd'] = rng.random(len(sessions)) / 10
+    sessions['lower_CI'] = sessions['estimate'] - 2 * sessions['sd']
+    sessions['upper_CI'] = sessions['estimate'] + 2 * sessions['sd']
+    sessions['trials'] = rng.integers(50, 1500, len(sessions))
+    sessions.to_csv(os.path.join(path, 'MCI_BayesModelSessions_LC_20230612.csv'), sep=';', decimal=',',
+                    index=False)
+
+
+def get_stages():
+    # Stages timed on every export, in order: (name, function, clear). With clear the in-memory cache of conf
+    # is emptied before the stage, otherwise the stage uses the data loaded by the previous ones; the derived
+    # tables are computed without the memoize cache (__wrapped__)
+    tasks = {'selection': conf.tasks_order, 'selection_xpos': [-8, 0, 8]}
+    return [('get_data (parse)', lambda: conf.get_data(), True),
+            ('get_data (columns)', lambda: conf.get_data(columns=conf.data_columns['performance']), True),
+            ('get_data (parquet)', lambda: conf.get_data(), True),
+            ('get_sessions_df', lambda: conf.get_sessions_df.__wrapped__(), False),
+            ('get_performance', lambda: conf.get_performance.__wrapped__(), False),
+            ('get_bayes', lambda: conf.get_bayes.__wrapped__(), False),
+            ('get_raw_data', lambda: conf.get_raw_data(columns=conf.data_columns['bouts']), False),
+            ('get_bouts_df', lambda: conf.get_bouts_df(conf.get_raw_data(columns=conf.data_columns['bouts']),
+                                                       tasks, minSize=conf.get_analysis()['bout_minSize']), False),
+            ('write_dataset', lambda: conf.write_dataset(), False),
+            ('get_data (filtered)', lambda: conf.get_data(animals=['al'], sessions=[1, 2]), False)]
+
+
+def time_stage(function):
+    # Wall time, CPU time, peak memory allocated on top of the memory already in use (MB) and rows of the
+    # result of function(). tracemalloc runs for the whole benchmark (see run): stopping it while the threads
+    # of pyarrow free their buffers crashes the interpreter, so only its peak is reset for every stage.
+    tracemalloc.reset_peak()
+    in_use = tracemalloc.get_traced_memory()[0]
+    start, cpu = time.perf_counter(), time.process_time()
+    result = function()
+    return {'seconds': time.perf_counter() - start,
+            'cpu_seconds': time.process_time() - cpu,
+            'peak_MB': (tracemalloc.get_traced_memory()[1] - in_use) / 1024 ** 2,
+            'rows': conf.count_rows(result)}
+
+
+def run_size(name, seed=0):
+    # Time the stages on the export of size name, in its own folder (the paths of conf are relative)
+    folder = os.path.abspath("{}{}/".format(benchmark_path, name))
+    cwd = os.getcwd()
+    os.makedirs(folder, exist_ok=True)
+    os.chdir(folder)
+    try:
+        stages = {}
+        if not os.path.exists('dataframes/MCI_export_20230101.csv'):
+            stages['make_export'] = time_stage(lambda: make_export('dataframes', sizes[name], seed))
+        conf.clear_cache(data=True)
+
+        for stage, function, clear in get_stages():
+            if clear:
+                conf._memory.clear()
+                conf._projections.clear()
+            stages[stage] = time_stage(function)
+            print("{:<6}{:<22}{:8.2f} s {:10.1f} MB".format(name, stage, stages[stage]['seconds'],
+                                                             stages[stage]['peak_MB']))
+        return stages
+    finally:
+        conf._memory.clear()
+        conf._projections.clear()
+        os.chdir(cwd)
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(size_list, output=None, seed=0):
+    # the stages are timed here, without the stage trace of conf (see conf.stage)
+    conf.trace = False
+    tracemalloc.start()
+    report = {'commit': get_commit(),
+              'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'python': platform.python_version(),
+              'pandas': pd.__version__,
+              'numpy': np.__version__,
+              'seed': seed,
+              'sizes': {name: run_size(name, seed) for name in size_list}}
+    tracemalloc.stop()
+
+    if output is None:
+        output = "{}benchmark_{}.json".format(benchmark_path, report['commit'] or time.strftime('%Y%m%d_%H%M%S'))
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("report written to {}".format(output))
+    return report
+
+
+def compare(old, new):
+    # Ratios new / old of the time and peak memory of the stages in both reports
+    rows = []
+    for name in [n for n in new['sizes'] if n in old['sizes']]:
+        for stage, values in new['sizes'][name].items():
+            before = old['sizes'][name].get(stage)
+            if before is None:
+                continue
+            rows.append({'size': name, 'stage': stage,
+                         'seconds_old': before['seconds'], 'seconds_new': values['seconds'],
+                         'time_ratio': values['seconds'] / before['seconds'] if before['seconds'] else np.nan,
+                         'MB_old': before['peak_MB'], 'MB_new': values['peak_MB'],
+                         'memory_ratio': values['peak_MB'] / before['peak_MB'] if before['peak_MB'] else np.nan})
+    return pd.DataFrame(rows, columns=['size', 'stage', 'seconds_old', 'seconds_new', 'time_ratio',
+                                       'MB_old', 'MB_new', 'memory_ratio'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the derivation functions of the MCI analysis')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='time the stages on synthetic exports and write a JSON report')
+    run_parser.add_argument('--sizes', default='10k,1M',
+                            help='comma separated sizes of the exports, of {} (default: 10k,1M)'.format(
+                                ', '.join(sizes)))
+    run_parser.add_argument('--output', help='path of the report (default: {}benchmark_<commit>.json)'.format(
+        benchmark_path))
+    run_parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic exports (default: 0)')
+    compare_parser = commands.add_parser('compare', help='compare two reports')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.old) as f_old, open(args.new) as f_new:
+            table = compare(json.load(f_old), json.load(f_new))
+        print(table.to_string(index=False, float_format='{:.2f}'.format))
+    else:
+        size_list = [s.strip() for s in args.sizes.split(',')]
+        unknown = [s for s in size_list if s not in sizes]
+        if unknown:
+            parser.error("unknown sizes: {}".format(', '.join(unknown)))
+        os.makedirs(benchmark_path, exist_ok=True)
+        run(size_list, output=args.output, seed=args.seed)
@@ -3,8 +3,45 @@ Configuration file for the data analysis of the MCI project.
 - get_modules
     it returns a list of modules necessary for the analysis
 
+- import_modules / get_import_times
+    it binds the modules of get_modules() in the namespace of a script as LazyModule objects,
+    imported on first use (modules not installed are skipped), and reports the import times
+
 - get_data
-    it returns the curated dataframe
+    it returns the curated dataframe, loaded from a parquet cache of the newest export when available;
+    get_data(animals=[...], tasks=[...], sessions=range(...)) returns only the selected trials, read from
+    the partitioned dataset, and get_data(columns=[...]) only the columns given (see figure_columns)
+
+- write_dataset / read_dataset
+    it materializes the curated dataframe as a Hive-style partitioned parquet dataset (group=/animal=/)
+    in dataset_path, and reads the trials of some animals, tasks and sessions from it with the filters
+    pushed down to the partitions and row groups
+
+- ingest_data / get_update
+    it curates the newest export, parsing only the rows appended to the previously ingested export when
+    the newest one extends it (incremental_ingestion), and reports the (group, session_relative, animal)
+    partitions touched by those rows, so that the memoized tables are updated only for them
+
+- compact_data / memory_report
+    it casts the columns of the data to the dtypes of data_schema (categoricals, small integers, integer
+    timestamps), as read_data and read_raw_data do, and reports the memory of each column before and after:
+        python anc_MCI_configuration.py memory [--raw]
+
+- TrialIndex
+    it sorts the trials by animal -> session -> bout (or other keys) once, with the range of rows of every
+    animal, session and bout, so that index.get(animal, session, bout) returns their trials as a view
+    instead of masking the whole dataframe
+
+- get_raw_data
+    it returns the newest export without the version curation (groups numbered by raw_groups_map,
+    sessions numbered by date), as used by Figure S2
+
+- share_data / read_shared
+    it writes a dataframe to a memory-mapped Arrow file and reads it back in the worker processes
+    of anc_MCI_pipeline.py (run --jobs N)
+
+- get_fingerprint
+    it returns a content hash of a data file (recomputed only when its size or mtime change)
 
 - get_path_*
     it returns the relevant paths of the project:
@@ -19,34 +56,134 @@ Configuration file for the data analysis of the MCI project.
     - tickFontSize
     - labelFontSize
     - titleFontSize
+    - render
     - sns_style
     - sns_context
 
-- get_session
-    it returns a new dataframe based on sessions (rows)
+- stage / write_trace
+    it traces a stage of a run (context manager or decorator): its wall and CPU time, the peak RSS of the
+    process so far and how much the stage raised it, and its
+    rows, and writes the stages of the run in results_path as <name>_trace.jsonl (one line per stage, appended
+    for every run) and <name>_trace.json (Chrome trace, for chrome://tracing or ui.perfetto.dev); with
+    MCI_PROFILE=cprofile (or pyinstrument) the whole run is also profiled (<name>_profile.*)
+
+- plot_figure / render_figures
+    it draws a panel of a figure script (or skips it, or defers it as a spec until render_figures),
+    according to render: 'full', 'tables' (tables only) or 'deferred' (Agg, only the panels saved as pdf)
+
+- get_sessions_df
+    it returns a new dataframe based on sessions (rows); with flat_times=True without the per-trial times,
+    which get_session_times returns as flat arrays plus offsets instead of lists in the cells
 
-- get_bouts
-    it returns a new dataframe based on bouts (rows)
+- get_session_times / split_times
+    it returns the flat per-trial times of get_sessions_df(flat_times=True) memory-mapped from .npy files
+    in memo_path, and split_times gives the times of each session as a view of them (no copy)
+
+- get_bouts_df / iter_bouts_df
+    it returns (or yields one animal at a time) the proportion of each category of one or more columns
+    in bins of trials of the bouts that include a set change; the bouts are walked once for all columns
 
 - get_betas
     it returns a new dataframe with beta values from the bayesian analysis
 
-- get_performance
+- get_bayes / read_bayes
+    it returns the model, points and sessions tables of the bayesian analysis, from the latest export of
+    each kind (bayes_files), validated against bayes_schema and converted once to parquet; with animals and
+    columns (bayes_columns of a figure) only those rows and columns are read from the parquet copy. The
+    tables are memoized on disk, keyed on the content of the exports (bayes_sources)
+
+- model_array
+    it returns the estimates and credible intervals of the model table as a dense animal x selection x stat
+    array with the index of the animals, as get_bayes(dense=True) adds to its tables
+
+- summarize_draws / summarize_bayes / QuantileSketch
+    it summarizes the posterior draws of the model and sessions tables (mean, sd and credible interval at
+    credible_level of get_analysis) reading the draw exports in blocks, with running means and variances
+    and a t-digest of the draws of every animal x selection (x session), instead of the stored summaries
+
+- chance_level
+    it returns the chance level of stimulus sizes at viewing_distance: the measured one (measured_chance, at
+    measured_distance) or the one of the area of the stimulus on the screen, computed once per size
+
+- get_performance / get_sweet_spots
+    it returns the hit rates of the static and dynamic tasks and the sweet spot of each animal, and the
+    distribution of the sweet spots over binomial resamples of the trials of every animal x size x speed cell
+
+- partial_corr
+    it returns the (partial) pearson correlation of two columns for every animal (or any grouping)
+    at once, with the same statistics as pingouin.partial_corr
+
+- resample_corr
+    it returns bootstrap CIs and permutation p-values of the correlations of partial_corr, with all the
+    replicates drawn as index matrices and their correlations computed in batches (n_boot, n_perm and
+    seed in get_analysis, jobs threads)
+
+- memoize
+    it keeps the results of the get_* functions in memory, so that all figures run in one process
+    (anc_MCI_pipeline.py) share them, and stores the derivations on disk (memo_path), keyed on the
+    curated data, the arguments, the analysis parameters and the code; the disk cache is bounded
+    by cache_size and can be inspected or cleared with:
+        python anc_MCI_configuration.py cache info
+        python anc_MCI_configuration.py cache clear [--data]
 author acalapai@dpz.eu
 """
 from pathlib import Path
+import functools
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import io
+import json
 import os
+import pickle
+import re
+import shutil
+import sys
+import urllib.parse
+import time
+import warnings
 import pandas as pd
 import numpy as np
 
 plot_path = './plots/'
 data_path = './dataframes/'
 results_path = './results/'
+cache_path = './dataframes/cache/'
+memo_path = './dataframes/cache/derived/'
+dataset_path = './dataframes/cache/dataset/'
+
+# Size limit of the derived tables cache (least recently used tables are evicted first)
+# and version of the derivation code, to be increased when a helper used by a memoized function changes
+cache_size = 2 * 1024 ** 3
+cache_version = 1
+
+# Rows per row group of the partitioned dataset: the trials of an animal are stored in recording order,
+# so that smaller row groups let a filter on the sessions skip more of them
+dataset_row_group = 64 * 1024
 
 sizeMult = 1
 saveplot = 0
 savetable = 1
 
+# How the figure scripts handle their panels (the tables in results/ are written in every mode):
+# - 'full': every panel is drawn while the script runs
+# - 'tables': no panel is drawn (matplotlib and seaborn are not even imported)
+# - 'deferred': the panels are kept as specs and drawn with the Agg backend by render_figures(),
+#   only when they are saved as pdf (saveplot)
+# It can be set for a single run with the MCI_RENDER environment variable
+render_modes = ['full', 'tables', 'deferred']
+render = os.environ.get('MCI_RENDER', 'full')
+
+# Stages of a run traced by stage() and written by write_trace() (MCI_TRACE=0 turns it off), and profiler
+# of the whole run ('cprofile' or 'pyinstrument', from MCI_PROFILE; None to not profile)
+trace = os.environ.get('MCI_TRACE', '1') != '0'
+profile = os.environ.get('MCI_PROFILE')
+profilers = ['cprofile', 'pyinstrument']
+
+sns_style = 'whitegrid'
+sns_context = 'paper'
+
 tickFontSize = 8
 labelFontSize = 10
 legendFontSize = 9
@@ -54,6 +191,99 @@ titleFontSize = 10
 
 tasks_order = ['static', 'dynamic', 'pictures']
 
+# Chance levels (%) measured for the stimulus sizes (degrees of visual angle) used so far, on a screen at a
+# distance of measured_distance (cm), and distance of the screen of the analysis: other sizes and distances get
+# the chance level of the area of the stimulus on the screen (see chance_level)
+measured_distance = 24
+measured_chance = {5: 7.33, 6: 10.53, 7: 14.41, 8: 18.81, 9: 23.99, 10: 30.24}
+viewing_distance = 24
+
+# Software versions kept in the curated dataframe: None keeps every group, a list only the groups named
+version_rules = {'v04': None,
+                 'v02': ['natvin', 'casear']}
+
+# Parse only the rows appended to the previously ingested export when the newest export extends it
+# (the derived tables are then updated only for the partitions touched by the new rows)
+incremental_ingestion = True
+partition_columns = ['group', 'session_relative', 'animal']
+
+# Dtypes of the columns of the curated and raw data (see compact_data): categoricals for the repeated strings
+# and identifiers, the smallest integers holding the task parameters and counters, and integer microseconds
+data_schema = {'animal': 'category', 'group': 'category', 'version': 'category', 'date': 'category',
+               'selection': 'category', 'outcome': 'category', 'bout_ID': 'category',
+               'session_relative': 'int16', 'trial': 'int32', 'size': 'int8', 'speed': 'int16',
+               'selection_xpos': 'int8', 'setChange_flag': 'int8',
+               'trial_start': 'int64', 'session_end': 'int64'}
+
+# Columns stored as categoricals in the curated dataframe (and in its parquet cache)
+categorical_columns = [c for c, dtype in data_schema.items() if dtype == 'category']
+
+# Export columns parsed directly as categoricals, instead of being inferred as strings first
+export_dtypes = {c: 'category' for c in categorical_columns if c not in ['animal', 'group']}
+
+# Columns of the data used by the derived tables and by each figure script (of get_raw_data for Figure S2):
+# get_data(columns=...) parses only those, and the tables then take theirs from the figure's columns
+data_columns = {'sessions': ['group', 'session_relative', 'animal', 'trial_start', 'session_end'],
+                'performance': ['group', 'animal', 'session_relative', 'selection', 'size', 'speed', 'outcome'],
+                'bouts': ['group', 'animal', 'session_relative', 'bout_ID', 'setChange_flag', 'selection',
+                          'selection_xpos']}
+figure_columns = {'Figure_2': data_columns['sessions'],
+                  'Figure_3': [],
+                  'Figure_4': data_columns['performance'],
+                  'Figure_S1': [],
+                  'Figure_S2': data_columns['bouts']}
+
+# Exports of the bayesian analysis in data_path (the latest of each kind, by the date in the name) and the columns
+# each table must have once read (see validate_bayes), with their kind of values; other columns are kept
+bayes_files = {'model': 'MCI_BayesModel_*.csv',
+               'points': 'MCI_BayesPoints_*.csv',
+               'sessions': 'MCI_BayesModelSessions_*.csv',
+               'model_draws': 'MCI_BayesModelDraws_*.csv',
+               'sessions_draws': 'MCI_BayesModelSessionsDraws_*.csv'}
+bayes_schema = {'model': {'animal': 'str', 'selection': 'str', 'estimate': 'float', 'sd': 'float',
+                          'lower_CI': 'float', 'upper_CI': 'float'},
+                'points': {'group': 'int', 'animal': 'str', 'selection': 'str', 'selection_position': 'str',
+                           'estimate': 'float', 'trial': 'int'},
+                'sessions': {'animal': 'str', 'selection': 'str', 'session': 'int', 'estimate': 'float',
+                             'trials': 'int'},
+                'model_draws': {'animal': 'str', 'selection': 'str', 'value': 'float'},
+                'sessions_draws': {'animal': 'str', 'selection': 'str', 'session': 'int', 'value': 'float'}}
+
+# Rows of a draw export read at once by summarize_draws, and compression of the sketch of the draws of a group
+draws_chunk_rows = 1024 ** 2
+draws_compression = 500
+
+# Columns of the bayesian tables used by each figure script: get_bayes(columns=...) reads only those
+bayes_columns = {'Figure_3': {'model': list(bayes_schema['model']),
+                              'points': list(bayes_schema['points']),
+                              'sessions': ['animal']},
+                 'Figure_S1': {'model': ['animal', 'selection'],
+                               'points': ['group', 'animal'],
+                               'sessions': list(bayes_schema['sessions'])}}
+
+# Group identifiers of the uncurated export (all versions) returned by get_raw_data (Figure S2)
+raw_groups_map = {'alwcla': 1, 'bacnil': 2, 'casear': 3, 'curpin': 4,
+                  'derelm': 5, 'natvin': 6, 'heilotpansan': 7}
+
+# Results of the memoized get_* functions already computed in this process
+_memory = {}
+
+# Seconds spent importing each module loaded through import_modules
+_import_times = {}
+
+# Panels waiting for render_figures() in the deferred render mode
+_figures = []
+
+# Dataframes read with only some of their columns (see read_columns), by kind of data
+_projections = {}
+
+# Stages traced since the last write_trace, the stages running (innermost last), the start of the run
+# (wall, CPU and epoch seconds) and its profiler
+_stages = []
+_running = []
+_run = (time.perf_counter(), time.process_time(), time.time())
+_profiler = None
+
 def get_modules():
     modules = [("statsmodels.stats.multitest", "ONLY", "multipletests"),
                ("pathlib", "ONLY", "Path"),
@@ -72,6 +302,232 @@ def get_modules():
     return modules
 
 
+class LazyModule:
+    # Stand-in for a module (or an object imported from it) that is imported on first use.
+    # Once loaded, the name in the namespace of the script is rebound to the real object.
+    def __init__(self, module, attribute=None, namespace=None, name=None):
+        self._module = module
+        self._attribute = attribute
+        self._namespace = namespace
+        self._name = name
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            start = time.perf_counter()
+            with stage('import ' + self._module):
+                target = importlib.import_module(self._module)
+            if self._attribute is not None:
+                target = getattr(target, self._attribute)
+            _import_times[self._module] = time.perf_counter() - start
+            self._target = target
+            if self._namespace is not None and self._namespace.get(self._name) is self:
+                self._namespace[self._name] = target
+        return self._target
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        state = 'loaded' if self._target is not None else 'not loaded'
+        return "<lazy {} ({})>".format(self._module if self._attribute is None else
+                                       self._module + '.' + self._attribute, state)
+
+
+def import_modules(namespace, modules=None):
+    # Bind the modules of get_modules() in namespace (e.g. globals() of a figure script) without
+    # importing them; modules that are not installed are skipped and returned
+    skipped = []
+    for m in modules or get_modules():
+        if isinstance(m, tuple):
+            module, name = m[0], m[-1]
+            attribute = m[2] if len(m) == 3 else None
+        else:
+            module, name, attribute = m, m, None
+
+        if module in sys.modules:
+            target = sys.modules[module]
+            namespace[name] = target if attribute is None else getattr(target, attribute)
+        elif importlib.util.find_spec(module.split('.')[0]) is None:
+            skipped.append(module)
+        else:
+            namespace[name] = LazyModule(module, attribute, namespace, name)
+    return skipped
+
+
+def get_import_times():
+    return pd.Series(_import_times, name='seconds', dtype=float).sort_values(ascending=False)
+
+
+def stage(name=None, rows=None, **info):
+    # A stage of a run, traced when trace is set (see write_trace), as a context manager:
+    #     with conf.stage('fit') as s:
+    #         ...
+    #         s.rows = len(df)
+    # or as a decorator (@conf.stage or @conf.stage('name')), counting the rows of the result (count_rows);
+    # info (or s.info) is added to the record of the stage
+    if callable(name):
+        return Stage()(name)
+    return Stage(name, rows, info)
+
+
+class Stage:
+    # Wall time, CPU time (of all the threads of the process) and memory of a block, recorded in _stages when it
+    # exits, under the stage that was running when it was entered: the peak RSS of the process so far when the
+    # block exits (process_peak_rss_MB) and how much the block raised it (peak_rss_growth_MB, 0 for a block that
+    # stays below an earlier peak)
+    def __init__(self, name=None, rows=None, info=None):
+        self.name = name
+        self.rows = rows
+        self.info = dict(info or {})
+
+    def __enter__(self):
+        if trace:
+            start_profile()
+            self.parent = _running[-1].name if _running else None
+            self.depth = len(_running)
+            _running.append(self)
+            self.rss = peak_rss()
+            self.start = time.perf_counter()
+            self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not trace or self not in _running:
+            return False
+        seconds = time.perf_counter() - self.start
+        cpu_seconds = time.process_time() - self.cpu
+        _running.remove(self)
+        rss = peak_rss()
+        record = {'stage': self.name, 'parent': self.parent, 'depth': self.depth, 'start': self.start,
+                  'seconds': round(seconds, 6), 'cpu_seconds': round(cpu_seconds, 6), 'process_peak_rss_MB': rss,
+                  'peak_rss_growth_MB': None if rss is None else round(rss - self.rss, 1), 'rows': self.rows}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        _stages.append(dict(record, **self.info))
+        return False
+
+    def __call__(self, func):
+        name = self.name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Stage(name, self.rows, self.info) as s:
+                result = func(*args, **kwargs)
+                if trace and s.rows is None:
+                    s.rows = count_rows(result)
+            return result
+        return wrapper
+
+
+def count_rows(result):
+    # Rows of a result: its length, the rows of the first table of a tuple (or list) of tables, the sum over
+    # the tables of a dict, and None for results without rows (or a length, e.g. a path)
+    if isinstance(result, str):
+        return None
+    if isinstance(result, (tuple, list)):
+        return count_rows(result[0]) if len(result) else 0
+    if isinstance(result, dict):
+        counts = [count_rows(r) for r in result.values()]
+        return None if None in counts else sum(counts)
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def peak_rss():
+    # Peak resident memory of the process so far (MB), None without the resource module (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kilobytes, bytes on macOS
+    return round(rss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def start_profile():
+    # Start the profiler of the run (set by profile) if it is not running yet; pyinstrument falls back
+    # to cProfile when it is not installed
+    global _profiler
+    if profile is None or _profiler is not None:
+        return
+    if profile not in profilers:
+        raise ValueError("unknown profiler '{}' (expected one of: {})".format(profile, ', '.join(profilers)))
+
+    if profile == 'pyinstrument' and importlib.util.find_spec('pyinstrument') is not None:
+        from pyinstrument import Profiler
+        _profiler = Profiler()
+        _profiler.start()
+    else:
+        if profile == 'pyinstrument':
+            warnings.warn("pyinstrument is not installed, the run is profiled with cProfile")
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop_profile(name):
+    # Stop the profiler of the run and write its profile in results_path: <name>_profile.prof (cProfile,
+    # for pstats or snakeviz) with the functions by cumulative time in <name>_profile.txt, or
+    # <name>_profile.html (pyinstrument)
+    global _profiler
+    if _profiler is None:
+        return
+    profiler, _profiler = _profiler, None
+    os.makedirs(results_path, exist_ok=True)
+    prefix = "{}{}_profile".format(results_path, name)
+
+    if hasattr(profiler, 'output_html'):
+        profiler.stop()
+        with open(prefix + '.html', 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(prefix + '.prof')
+        with open(prefix + '.txt', 'w') as f:
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(50)
+
+
+def write_trace(name):
+    # Write the stages traced since the last call (or since conf was imported) as the run name in results_path:
+    # one JSON line per stage, and one for the whole run, appended to <name>_trace.jsonl, and the Chrome trace
+    # of the run in <name>_trace.json; the stages run outside any other stage are the children of the run
+    global _run
+    run, _run = _run, (time.perf_counter(), time.process_time(), time.time())
+    stages = _stages[:]
+    del _stages[:]
+    stop_profile(name)
+    if not trace:
+        return
+
+    records = [{'stage': name, 'parent': None, 'depth': 0, 'start': 0.0, 'seconds': round(_run[0] - run[0], 6),
+                'cpu_seconds': round(_run[1] - run[1], 6), 'process_peak_rss_MB': peak_rss(),
+                'peak_rss_growth_MB': None, 'rows': None}]
+    for record in stages:
+        records.append(dict(record, parent=record['parent'] or name, depth=record['depth'] + 1,
+                            start=round(record['start'] - run[0], 6)))
+
+    os.makedirs(results_path, exist_ok=True)
+    date = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(run[2]))
+    with open("{}{}_trace.jsonl".format(results_path, name), 'a') as f:
+        for record in records:
+            f.write(json.dumps(dict({'run': date, 'pid': os.getpid()}, **record), default=str) + '\n')
+
+    # complete events ('X', in microseconds), sorted so that every stage comes before the stages it contains
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': name}}]
+    for record in sorted(records, key=lambda r: (r['start'], -r['seconds'])):
+        events.append({'name': record['stage'], 'cat': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                       'ts': round(record['start'] * 1e6), 'dur': round(record['seconds'] * 1e6),
+                       'args': {k: v for k, v in record.items() if k not in ['stage', 'start', 'seconds']}})
+    with open("{}{}_trace.json".format(results_path, name), 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'run': date}}, f, default=str)
+
+
 def get_path(whichpath):
     if 'plot' in whichpath:
         return plot_path
@@ -81,28 +537,610 @@ def get_path(whichpath):
         return results_path
 
 
-def get_data():
+def get_fingerprint(data_file):
+    # The content hash is stored next to the cache and only recomputed when size or mtime change
+    stat = os.stat(data_file)
+    index_file = cache_path + 'fingerprints.json'
+    index = {}
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+
+    name = os.path.abspath(data_file)
+    if name in index and index[name][:2] == [stat.st_size, stat.st_mtime_ns]:
+        return index[name][2]
+
+    sha = hashlib.sha1()
+    with open(data_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+
+    index[name] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+    os.makedirs(cache_path, exist_ok=True)
+    with open(index_file, 'w') as f:
+        json.dump(index, f)
+    return sha.hexdigest()
+
+
+def get_data_file():
     data_files = os.listdir(data_path)
     data_files = sorted(list(filter(lambda f: f.endswith('.csv'), data_files)))
-    data_file = data_path + data_files[-1]
+    return data_path + data_files[-1]
 
-    df = pd.read_csv(data_file, low_memory=False, decimal=',')
-    df = df[(df['version'] == 'v04') |
-            ((df['group'] == 'natvin') & (df['version'] == 'v02') |
-             (df['group'] == 'casear') & (df['version'] == 'v02'))]
+
+def get_data_key(data_file):
+    # The curated data is identified by the source file (size, mtime and content) and by the curation rules
+    stat = os.stat(data_file)
+    key = json.dumps([stat.st_size, stat.st_mtime_ns, get_fingerprint(data_file),
+                      version_rules, data_schema, raw_groups_map])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def memoize(func=None, disk=True, update=None, sources=None):
+    # Keep the results of a get_* function in memory and, with disk=True, in memo_path. The key combines
+    # the curated data, the arguments, the analysis parameters and the source of the function, and what
+    # sources() returns for functions reading other files (e.g. their content hashes, see bayes_sources).
+    # In-memory hits return shallow copies, so scripts adding columns do not affect other consumers.
+    # update(previous, touched, *args, **kwargs) derives the result from the one stored for the previous
+    # curated data when the current data was ingested incrementally from it (see get_update).
+    if func is None:
+        return functools.partial(memoize, disk=disk, update=update, sources=sources)
+    code = hashlib.sha1((inspect.getsource(func) + str(cache_version)).encode()).hexdigest()
+
+    def get_key(data_key, args, kwargs):
+        key = [func.__name__, data_key, code, repr(args), repr(sorted(kwargs.items())), repr(get_analysis())]
+        if sources is not None:
+            key.append(sources())
+        key = json.dumps(key)
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def get_cache_file(key):
+        return "{}{}_{}.pkl".format(memo_path, func.__name__, key)
+
+    def memo_key(*args, **kwargs):
+        return get_key(get_data_key(get_data_file()), args, kwargs)
+
+    def compute(*args, **kwargs):
+        changes = get_update() if disk and update is not None else None
+        if changes is not None:
+            previous_file = get_cache_file(get_key(changes[0], args, kwargs))
+            if os.path.exists(previous_file):
+                with open(previous_file, 'rb') as f:
+                    return update(pickle.load(f), changes[1], *args, **kwargs)
+        return func(*args, **kwargs)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # traced as a stage, with where the result came from: 'memory', 'disk' or 'computed'
+        with stage(func.__name__) as s:
+            result = lookup(s.info, *args, **kwargs)
+            if trace:
+                s.rows = count_rows(result)
+        return result
+
+    def lookup(info, *args, **kwargs):
+        key = memo_key(*args, **kwargs)
+        cache_file = get_cache_file(key)
+
+        if key in _memory:
+            info['cache'] = 'memory'
+            return _shallow_copy(_memory[key])
+
+        if disk and os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(cache_file)  # mark as recently used
+            _memory[key] = result
+            info['cache'] = 'disk'
+            return _shallow_copy(result)
+
+        info['cache'] = 'computed'
+        result = compute(*args, **kwargs)
+        _memory[key] = result
+        if disk:
+            os.makedirs(memo_path, exist_ok=True)
+            tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+            evict_cache()
+        return _shallow_copy(result)
+
+    wrapper.memo_key = memo_key
+    return wrapper
+
+
+def _shallow_copy(result):
+    if isinstance(result, pd.DataFrame):
+        return result.copy(deep=False)
+    if isinstance(result, tuple):
+        return tuple(_shallow_copy(r) for r in result)
+    if isinstance(result, dict):
+        return {k: _shallow_copy(r) for k, r in result.items()}
+    return result
+
+
+def get_cache_files():
+    # Files of the derived tables cache: the pickled results of memoize and the arrays of get_session_times
+    return [f for pattern in ['*.pkl', '*.npy'] for f in Path(memo_path).glob(pattern)]
+
+
+def get_cache_info():
+    files = sorted(get_cache_files(), key=lambda f: f.stat().st_mtime, reverse=True)
+    return pd.DataFrame(data={
+        'file': [f.name for f in files],
+        'function': [f.name.split('.')[0].rsplit('_', 1)[0] for f in files],
+        'size_MB': [f.stat().st_size / 1024 ** 2 for f in files],
+        'last_used': [time.strftime('%Y-%m-%d %H:%M', time.localtime(f.stat().st_mtime)) for f in files]},
+        columns=['file', 'function', 'size_MB', 'last_used'])
+
+
+def evict_cache(max_size=None):
+    # Remove the least recently used tables until the cache fits in max_size bytes (cache_size by default)
+    if max_size is None:
+        max_size = cache_size
+    files = sorted(get_cache_files(), key=lambda f: f.stat().st_mtime)
+    total = sum(f.stat().st_size for f in files)
+    for f in files:
+        if total <= max_size:
+            break
+        total -= f.stat().st_size
+        f.unlink()
+
+
+def clear_cache(data=False):
+    evict_cache(max_size=0)
+    if data:  # also remove the parquet copies of the exports and the partitioned datasets
+        for f in Path(cache_path).glob('*.parquet'):
+            f.unlink()
+        shutil.rmtree(dataset_path, ignore_errors=True)
+
+
+@stage
+def share_data(df, name):
+    # Write df as an uncompressed Arrow IPC file that worker processes memory-map (see read_shared)
+    path = "{}shared_{}_{}.arrow".format(cache_path, name, get_data_key(get_data_file()))
+    try:
+        df.to_feather(path, compression='uncompressed')
+    except (ImportError, TypeError, ValueError):  # no pyarrow, or columns of mixed types
+        return None
+    return path
+
+
+def read_shared(path):
+    # Numeric columns are used in place from the memory-mapped file, only strings and categories are decoded
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def get_cache_file(data_file, kind='curated'):
+    return "{}{}_{}_{}.parquet".format(cache_path, Path(data_file).stem, kind, get_data_key(data_file))
+
+
+@stage
+def read_cached(data_file, reader, kind='curated'):
+    # Read data_file with reader() once, and from its parquet copy in cache_path afterwards
+    cache_file = get_cache_file(data_file, kind)
+    if os.path.exists(cache_file):
+        try:
+            return pd.read_parquet(cache_file)
+        except ImportError:  # no parquet engine (pyarrow) installed
+            pass
+
+    df = reader(data_file)
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    try:
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, cache_file)
+    except (ImportError, TypeError, ValueError):  # no parquet engine, or columns of mixed types
+        return df
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    prune_cached(data_file, kind)
+    return df
+
+
+def export_series(data_file):
+    # Exports superseding each other: those of a kind of bayes_files, and the trial exports ('data')
+    name = Path(data_file).name
+    return next((kind for kind, pattern in bayes_files.items() if Path(name).match(pattern)), 'data')
+
+
+def prune_cached(data_file, kind):
+    # Remove the parquet copies of kind of the previous versions of data_file and of the other exports of its
+    # series (e.g. older exports), so that cache_path does not grow with every data refresh
+    current = Path(get_cache_file(data_file, kind)).name
+    series = export_series(data_file)
+    for f in Path(cache_path).glob("*_{}_*.parquet".format(kind)):
+        match = re.fullmatch(r'(.+)_{}_[0-9a-f]{{16}}\.parquet'.format(re.escape(kind)), f.name)
+        if match and f.name != current and export_series(match.group(1) + '.csv') == series:
+            f.unlink()
+
+
+@stage
+def read_data(data_file, groups_map=None, columns=None, compact=True):
+    # groups_map numbers the groups, the groups not in it are added in order of first appearance;
+    # with columns, only those columns of the curated data (and the ones the curation needs) are parsed,
+    # and with compact=False the columns keep the dtypes inferred by pandas (see memory_report)
+    usecols = None
+    if columns is not None:
+        usecols = {'manual_label' if c == 'animal' else c for c in columns} | {'version', 'group', 'manual_label'}
+    df = pd.read_csv(data_file, low_memory=False, decimal=',', usecols=usecols,
+                     dtype=export_dtypes if compact else None)
+
+    keep = np.zeros(len(df), dtype=bool)
+    for version, groups in version_rules.items():
+        rule = df['version'] == version
+        if groups is not None:
+            rule &= df['group'].isin(groups)
+        keep |= rule.to_numpy()
+    df = df[keep]
 
     # out = df[['group', 'version', 'session_relative']].value_counts().sort_index()
     df['manual_label'] = df['manual_label'].str[:2]
     df.rename(columns={"manual_label": "animal"}, inplace=True)
 
-    groups_map = dict(zip(df.group.unique(), range(1, len(df.group.unique()) + 1)))
-    df = df.replace({'group': groups_map}).reset_index(drop=True)
+    if groups_map is None:
+        groups_map = {}
+    for g in df['group'].unique():
+        groups_map.setdefault(g, len(groups_map) + 1)
+    df['group'] = df['group'].map(groups_map)
+    df = df.reset_index(drop=True)
+
+    if compact:
+        df = compact_data(df)
+        for c in categorical_columns:
+            if c in df:
+                df[c] = df[c].cat.remove_unused_categories()  # of the parsed rows not kept
+    return df if columns is None else df[list(columns)]
+
+
+def compact_data(df):
+    # df with its columns cast to the dtypes of data_schema. The integer dtypes are used only when they hold
+    # the values exactly (no missing values, whole numbers, in the range of the dtype), the others are kept.
+    df = df.copy(deep=False)
+    for c, dtype in data_schema.items():
+        if c not in df or df[c].dtype == dtype:
+            continue
+        if dtype == 'category':
+            df[c] = df[c].astype('category')
+        elif df[c].dtype.kind in 'iuf':
+            values = df[c].to_numpy()
+            with np.errstate(invalid='ignore'):
+                compact = values.astype(dtype)
+            if (compact == values).all():
+                df[c] = compact
+    return df
+
+
+def memory_report(df):
+    # Memory of each column of df (as parsed, see read_data(compact=False)) before and after compact_data
+    compact = compact_data(df)
+    report = pd.DataFrame(data={
+        'column': df.columns,
+        'dtype_before': [str(df[c].dtype) for c in df.columns],
+        'MB_before': df.memory_usage(deep=True, index=False).to_numpy() / 1024 ** 2,
+        'dtype_after': [str(compact[c].dtype) for c in df.columns],
+        'MB_after': compact.memory_usage(deep=True, index=False).to_numpy() / 1024 ** 2})
+    total = pd.DataFrame(data={'column': ['total'], 'dtype_before': [''], 'MB_before': [report['MB_before'].sum()],
+                               'dtype_after': [''], 'MB_after': [report['MB_after'].sum()]})
+    report = pd.concat([report, total], ignore_index=True)
+    report['ratio'] = report['MB_before'] / report['MB_after']
+    return report
+
+
+def get_manifest():
+    # State of the ingested exports (see ingest_data), one entry per kind of data
+    manifest_file = cache_path + 'manifest.json'
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def ingest_data(data_file):
+    # Curate data_file, appending only its new rows to the cached previous export when possible
+    previous = get_manifest().get('curated')
+    rules = json.dumps([version_rules, data_schema])
+    appended = None
+    if incremental_ingestion and previous is not None and previous['rules'] == rules:
+        appended = append_data(data_file, previous)
+
+    if appended is None:
+        groups_map = {}
+        df = read_data(data_file, groups_map)
+    else:
+        df, groups_map, touched = appended
+
+    manifest = get_manifest()
+    manifest['curated'] = {'source': os.path.abspath(data_file),
+                           'size': os.stat(data_file).st_size,
+                           'fingerprint': get_fingerprint(data_file),
+                           'data_key': get_data_key(data_file),
+                           'cache_file': get_cache_file(data_file),
+                           'rules': rules,
+                           'groups_map': groups_map,
+                           'previous': None if appended is None else previous['data_key'],
+                           'touched': None if appended is None else touched.to_dict('list')}
+    os.makedirs(cache_path, exist_ok=True)
+    with open(cache_path + 'manifest.json', 'w') as f:
+        json.dump(manifest, f)
+    return df
+
+
+def append_data(data_file, previous):
+    # Curated data of data_file from the cached curated data of the previous export, when data_file starts
+    # with the same bytes as the previous export: only the rows after them are parsed. It returns the
+    # data, the updated groups_map and the partitions of the new rows (None when a full read is needed).
+    size = previous['size']
+    if os.stat(data_file).st_size < size or not os.path.exists(previous['cache_file']):
+        return None
+
+    sha = hashlib.sha1()
+    block = b''
+    with open(data_file, 'rb') as f:
+        header = f.readline()
+        f.seek(0)
+        while f.tell() < size:
+            block = f.read(min(1 << 20, size - f.tell()))
+            sha.update(block)
+        tail = f.read()
+    if sha.hexdigest() != previous['fingerprint'] or not block.endswith(b'\n'):
+        return None
+
+    try:
+        cached = pd.read_parquet(previous['cache_file'])
+    except ImportError:  # no parquet engine (pyarrow) installed
+        return None
+    groups_map = dict(previous['groups_map'])
+    new = read_data(io.BytesIO(header + tail), groups_map)
+    touched = new[partition_columns].drop_duplicates().reset_index(drop=True)
+    if len(new) == 0:
+        return cached, groups_map, touched
+
+    # the new rows must have been parsed as the whole file would have been (same columns, and numbers
+    # or strings in the same columns), otherwise the file is read again from scratch
+    if list(new.columns) != list(cached.columns):
+        return None
+    for c in cached.columns.difference(categorical_columns):
+        numeric = (cached[c].dtype.kind in 'iuf') and (new[c].dtype.kind in 'iuf')
+        if not (numeric or cached[c].dtype == new[c].dtype or new[c].isna().all()):
+            return None
+
+    df = pd.concat([cached, new], ignore_index=True)
+    for c in [c for c in categorical_columns if c in cached]:
+        try:
+            df[c] = pd.api.types.union_categoricals([cached[c].astype('category'), new[c]], sort_categories=True)
+        except TypeError:  # categories of different types
+            return None
+    return df, groups_map, touched
+
+
+def get_update():
+    # (data key of the previous curated data, partitions touched since) when the current curated data
+    # was appended to the previous one by ingest_data, None otherwise
+    entry = get_manifest().get('curated')
+    if entry is not None and entry['data_key'] != get_data_key(get_data_file()):
+        get_data()  # ingest the newest export
+        entry = get_manifest().get('curated')
+    if entry is None or entry['previous'] is None or entry['data_key'] != get_data_key(get_data_file()):
+        return None
+    return entry['previous'], pd.DataFrame(entry['touched'], columns=partition_columns)
+
+
+def partition_rows(df, partitions):
+    # Boolean mask of the rows of df in the partitions (rows of the partitions dataframe, on its columns);
+    # the columns are checked one at a time first, so that only the candidate rows are matched on all of them
+    keys = list(partitions.columns)
+    mask = np.ones(len(df), dtype=bool)
+    for k in keys:
+        mask &= df[k].isin(partitions[k].unique()).to_numpy()
+    rows = np.flatnonzero(mask)
+    candidates = pd.MultiIndex.from_arrays([df[k].to_numpy()[rows] for k in keys])
+    mask[rows] = candidates.isin(pd.MultiIndex.from_frame(partitions))
+    return mask
+
+
+@stage
+def read_raw_data(data_file, columns=None, compact=True):
+    usecols = None
+    if columns is not None:
+        usecols = {'manual_label' if c == 'animal' else c for c in columns} | {'group', 'manual_label', 'date',
+                                                                                  'session_relative'}
+    df = pd.read_csv(data_file, low_memory=False, decimal=',', usecols=usecols)
+
+    # assign unique number identifier to groups
+    df['group'] = df['group'].map({g: raw_groups_map.get(g, g) for g in df['group'].unique()})
+
+    df['manual_label'] = df['manual_label'].str[:2]
+    df.rename(columns={"manual_label": "animal"}, inplace=True)
+    df = df.reset_index(drop=True)
+
+    # number the sessions of each group by date
+    session = df.groupby('group', sort=False)['date'].transform(lambda d: pd.factorize(d, use_na_sentinel=False)[0] + 1)
+    df['session_relative'] = session.where(df['date'].notna(), df['session_relative'])
+    if compact:
+        df = compact_data(df)
+    return df if columns is None else df[list(columns)]
+
+
+def write_dataset():
+    # Partitioned copy (group=/animal=/) of the curated data in dataset_path/<data key>/, with the row labels
+    # in '_row' and the columns, dtypes and categories in _schema.json. After an incremental ingestion only
+    # the partitions touched by the new rows are written, the others are moved from the previous copy.
+    # It returns the path of the dataset, or None without pyarrow or when a column can not be stored.
+    path = "{}{}/".format(dataset_path, get_data_key(get_data_file()))
+    if os.path.exists(path):
+        return path
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        return None
+
+    data = get_data()
+    df = data
+    changes = get_update()
+    previous = None if changes is None else "{}{}/".format(dataset_path, changes[0])
+    if previous is not None and os.path.exists(previous):
+        touched = changes[1][['group', 'animal']].drop_duplicates()
+        df = df[partition_rows(df, touched)]
+        touched = set(touched.itertuples(index=False, name=None))
+    else:
+        previous = None
+
+    table = df.astype({c: object for c in categorical_columns if c in df and c != 'group'}).astype({'group': 'int64'})
+    tmp = "{}.{}.tmp/".format(path.rstrip('/'), os.getpid())
+    try:
+        table = pa.Table.from_pandas(table.reset_index(names='_row'), preserve_index=False)
+        ds.write_dataset(table, tmp, format='parquet', partitioning=['group', 'animal'], partitioning_flavor='hive',
+                         max_rows_per_group=dataset_row_group, existing_data_behavior='overwrite_or_ignore')
+    except (pa.ArrowException, TypeError, ValueError):  # columns of mixed types
+        shutil.rmtree(tmp, ignore_errors=True)
+        return None
+
+    if previous is not None:
+        for folder in Path(previous).glob('group=*/animal=*'):
+            group = int(urllib.parse.unquote(folder.parent.name.split('=', 1)[1]))
+            animal = urllib.parse.unquote(folder.name.split('=', 1)[1])
+            if (group, animal) not in touched:
+                target = "{}{}/{}".format(tmp, folder.parent.name, folder.name)
+                try:  # the files of the previous dataset are hard-linked when possible
+                    shutil.copytree(folder, target, copy_function=os.link, dirs_exist_ok=True)
+                except OSError:
+                    shutil.copytree(folder, target, dirs_exist_ok=True)
+
+    with open(tmp + '_schema.json', 'w') as f:
+        json.dump({'columns': list(data.columns),
+                   'dtypes': {c: str(data[c].dtype) for c in data.columns if c not in categorical_columns},
+                   'categories': {c: data[c].cat.categories.tolist() for c in categorical_columns if c in data}}, f)
+
+    # Replace the datasets of previous curated data
+    for folder in Path(dataset_path).glob('*'):
+        if folder.is_dir() and not folder.name.endswith('.tmp'):
+            shutil.rmtree(folder, ignore_errors=True)
+    try:
+        os.replace(tmp, path)
+    except OSError:  # written meanwhile by another process
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+
+@stage
+def read_dataset(animals=None, tasks=None, sessions=None, columns=None):
+    # Trials of the animals, tasks (selection) and sessions (session_relative) given, as get_data()[mask]
+    # would return them (same row labels, dtypes and categories). The animals select the partitions to
+    # read, the tasks and sessions are checked on the row group statistics before the rows are read,
+    # and only the columns given (all by default) are read.
+    path = write_dataset()
+    if path is None:
+        df = get_data()
+        mask = np.ones(len(df), dtype=bool)
+        for column, values in [('animal', animals), ('selection', tasks), ('session_relative', sessions)]:
+            if values is not None:
+                mask &= df[column].isin(list(values)).to_numpy()
+        return df[mask] if columns is None else df.loc[mask, list(columns)]
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    with open(path + '_schema.json') as f:
+        schema = json.load(f)
+    partitioning = ds.partitioning(pa.schema([('group', pa.int64()), ('animal', pa.string())]), flavor='hive')
+    dataset = ds.dataset(path, format='parquet', partitioning=partitioning)
+
+    expression = None
+    for column, values in [('animal', animals), ('selection', tasks), ('session_relative', sessions)]:
+        if values is not None:
+            condition = ds.field(column).isin(list(values))
+            expression = condition if expression is None else expression & condition
+
+    columns = schema['columns'] if columns is None else list(columns)
+    df = dataset.to_table(filter=expression, columns=columns + ['_row']).to_pandas()
+    df = df.set_index('_row').sort_index().rename_axis(None)
+    df = df[columns].astype({c: t for c, t in schema['dtypes'].items() if c in columns})
+    for c in categorical_columns:
+        if c in columns:
+            df[c] = pd.Categorical(df[c], categories=schema['categories'][c])
+    return df
+
+
+def read_columns(get, reader, kind, columns):
+    # Some columns of the curated (or raw) data: taken from the whole dataframe or from a dataframe with
+    # more columns when one is already in memory, read from the parquet copy of the export when there
+    # is one, and otherwise parsed from the export (only those columns), and cached in parquet
+    loaded = [_memory.get(get.memo_key())] + _projections.get(kind, [])
+    for df in loaded:
+        if df is not None and set(columns) <= set(df.columns):
+            return df[columns]
+
+    data_file = get_data_file()
+    df = None
+    if os.path.exists(get_cache_file(data_file, kind)):
+        try:
+            df = pd.read_parquet(get_cache_file(data_file, kind), columns=columns)
+        except ImportError:  # no parquet engine (pyarrow) installed
+            pass
+    if df is None:
+        projection = "{}-{}".format(kind, hashlib.sha1(json.dumps(columns).encode()).hexdigest()[:8])
+        df = read_cached(data_file, functools.partial(reader, columns=columns), kind=projection)
+
+    _projections.setdefault(kind, []).append(df)
+    return df
+
+
+@memoize(disk=False)
+def get_data(animals=None, tasks=None, sessions=None, columns=None):
+    # The trials of some animals, tasks or sessions only are read from the partitioned dataset,
+    # and only the columns given are parsed from the export (or taken from the data already loaded)
+    if animals is not None or tasks is not None or sessions is not None:
+        return read_dataset(animals=animals, tasks=tasks, sessions=sessions, columns=columns)
+
+    if columns is None:
+        df = read_cached(get_data_file(), ingest_data)
+    else:
+        # a copy, since the columns cast below may be a slice of a dataframe already in memory
+        df = read_columns(get_data, read_data, 'curated', list(columns)).copy(deep=False)
+
+    # parquet does not restore categoricals with integer categories (e.g. 'group')
+    for c in categorical_columns:
+        if c in df:
+            df[c] = df[c].astype('category')
+    return df
+
+
+@memoize(disk=False)
+def get_raw_data(columns=None):
+    if columns is not None:
+        df = read_columns(get_raw_data, read_raw_data, 'raw', list(columns)).copy(deep=False)
+    else:
+        df = read_cached(get_data_file(), read_raw_data, kind='raw')
+
+    # parquet does not restore categoricals with integer categories (e.g. 'group')
+    for c in categorical_columns:
+        if c in df:
+            df[c] = df[c].astype('category')
     return df
 
 
 def get_analysis():
+    # n_boot / n_perm: bootstrap and permutation replicates of the per-animal correlations (see resample_corr)
+    # credible_level: None for the summaries of the bayesian exports, or the level (e.g. 0.89) of the credible
+    # intervals recomputed from the posterior draws (see summarize_bayes)
+    # viewing_distance / measured_distance / measured_chance: the settings of the chance levels (see chance_level)
     parameters = dict({'bout_minSize': 10,
-                       'tasks_order': tasks_order})
+                       'tasks_order': tasks_order,
+                       'n_boot': 2000,
+                       'n_perm': 2000,
+                       'seed': 2022,
+                       'credible_level': None,
+                       'viewing_distance': viewing_distance,
+                       'measured_distance': measured_distance,
+                       'measured_chance': measured_chance})
     return parameters
 
 
@@ -115,166 +1153,880 @@ def get_plot():
                        'titleFontSize': titleFontSize,
                        'legendFontSize': legendFontSize,
                        'lineWidth': 1,
-                       'lineAlpha': 0.8})
+                       'lineAlpha': 0.8,
+                       'render': render,
+                       'sns_style': sns_style,
+                       'sns_context': sns_context})
     return parameters
 
 
-def get_sessions_df():
-    df = get_data()
-    T = df.groupby(['animal', 'session_relative'])['trial'].count().reset_index()
-
-    sessions_df = pd.DataFrame()
-    for group in df.group.unique():
-        # print("-" + " Processing data from group " + str(group))
-        for session in df[df['group'] == group].session_relative.unique():
-
-            if len(df[(df['group'] == group) & (df['session_relative'] == session)]) > 0:
-                unique_animals = df[(df['group'] == group) & (df['session_relative'] == session)]['animal'].unique()
-
-                # cycle through the animals expected in the session
-                for monkey in unique_animals:
-                    # create a table (A) with the animal information
-                    A = df[(df['group'] == group) & (df['session_relative'] == session) & (df['animal'] == monkey)]
-                    A = A.reset_index(drop=True)
-
-                    # create a table (B) with the session information
-                    B = df[(df['group'] == group) & (df['session_relative'] == session)]
-                    B = B.reset_index(drop=True)
-
-                    # look for trials initiated by the animal in table A
-                    if len(A) > 0:
-                        # extract all trial start times
-                        times = list(A['trial_start'] / A['trial_start'].values[-1])
-                        abs_times = list(A['trial_start'].values)
-
-                        # calculate the median of all start trial times
-                        medianTimes = np.median(times)
-
-                    # if there are no trials from animal A in this session
-                    else:
-                        # assign nans to missing information
-                        times = np.nan
-                        medianTimes = np.nan
-
-                    # temp = pd.DataFrame()
-                    # temp['group'] = group
-                    # temp['session'] = session
-                    # temp['duration'] = int(B.session_end[0] / 60000000)
-                    # temp['animal'] = monkey
-                    # temp['trials'] = len(A)
-                    # temp['times'] = list(times)
-                    # temp['abs_times'] = list(abs_times)
-                    # temp['medianTimes'] = medianTimes
-
-                    temp_df = pd.DataFrame(data={
-                        'group': group,
-                        'session': session,
-                        'duration': int(B.session_end[0] / 60000000),
-                        'animal': monkey,
-                        'trials': len(A),
-                        'times': [times],
-                        'abs_times': [abs_times],
-                        'medianTimes': medianTimes})
-
-                    sessions_df = pd.concat([sessions_df, temp_df], ignore_index=True)
-
-
-                    # sessions_df = sessions_df.append({
-                    #     'group': group,
-                    #     'session': session,
-                    #     'duration': int(B.session_end[0] / 60000000),
-                    #     'animal': monkey,
-                    #     'trials': len(A),
-                    #     'times': times,
-                    #     'abs_times': abs_times,
-                    #     'medianTimes': medianTimes},
-                    #     ignore_index=True)
+def plot_figure(plot_name, draw, *args, path=None, save=None, **kwargs):
+    # Draw a panel with draw(*args, **kwargs) and save it as <path><plot_name>.pdf, as set by render:
+    # the spec (name, drawing function and its data) is dropped, drawn now or kept for render_figures()
+    if render not in render_modes:
+        raise ValueError("unknown render mode '{}' (expected one of: {})".format(render, ', '.join(render_modes)))
+
+    spec = {'name': plot_name, 'draw': draw, 'args': args, 'kwargs': kwargs,
+            'path': plot_path if path is None else path, 'save': saveplot if save is None else save}
+    if render == 'full':
+        _draw_figure(spec)
+    elif render == 'deferred' and spec['save']:
+        _figures.append(spec)
+
+
+def render_figures():
+    # Draw and save the panels deferred so far, with the Agg backend (no window is opened)
+    if not _figures:
+        return
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+    while _figures:
+        _draw_figure(_figures.pop(0))
+        plt.close('all')
+
+
+def _draw_figure(spec):
+    with stage('draw ' + spec['name']):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        sns.set(style=sns_style)
+        sns.set_context(sns_context)
+        spec['draw'](*spec['args'], **spec['kwargs'])
+    if spec['save']:
+        with stage('savefig ' + spec['name']):
+            plt.savefig("{}{}{}".format(spec['path'], spec['name'], '.pdf'), format='pdf')
+
+
+class TrialIndex:
+    # Rows of a dataframe sorted by its keys (e.g. animal -> session -> bout), the groups of each key in order
+    # of first appearance and the rows of a group in their original order, with the range of sorted rows of
+    # every group at every level of the keys: get(animal, session, bout) returns the rows of one group as a
+    # slice (a view) of the sorted rows, without a mask over the whole dataframe. Rows missing a key are left out.
+    def __init__(self, df, keys=('animal', 'session_relative', 'bout_ID')):
+        self.keys = list(keys)
+        codes = [df.groupby(self.keys[:n], sort=False, observed=True).ngroup().to_numpy()
+                 for n in range(1, len(self.keys) + 1)]
+        rows = np.flatnonzero(codes[-1] >= 0)
+        self.order = rows[np.lexsort([c[rows] for c in codes[::-1]])]
+
+        # offsets[key][i]:offsets[key][i + 1] are the sorted rows of the i-th group of keys[:level of key + 1]
+        self.offsets = {}
+        for n, key in enumerate(self.keys):
+            starts = np.flatnonzero(np.diff(codes[n][self.order])) + 1
+            self.offsets[key] = np.r_[0, starts, len(self.order)] if len(self.order) else np.zeros(1, dtype=int)
+        self._df = df
+        self._data = None
+        self._ranges = None
+
+    @property
+    def data(self):
+        # the rows of the dataframe in sorted order (taken once, on first use)
+        if self._data is None:
+            self._data = self._df.take(self.order)
+        return self._data
+
+    def __len__(self):
+        return len(self.order)
+
+    def rows(self, *key):
+        # slice of the sorted rows of the group with the key values given (the first ones of keys)
+        if self._ranges is None:  # range of every group by its key values, built on the first lookup
+            self._ranges = {}
+            for key_name in self.keys:
+                groups = self.groups(key_name)
+                values = zip(*[groups[k].tolist() for k in self.keys[:self.keys.index(key_name) + 1]])
+                self._ranges.update(zip(values, zip(groups['start'].tolist(), groups['stop'].tolist())))
+        start, stop = self._ranges.get(key, (0, 0))
+        return slice(start, stop)
+
+    def get(self, *key):
+        return self.data.iloc[self.rows(*key)]
+
+    def groups(self, key):
+        # the groups of keys[:level of key + 1], with their key values and the range of their sorted rows
+        n = self.keys.index(key) + 1
+        first = self.order[self.offsets[key][:-1]]
+        groups = pd.DataFrame(data={k: self._df[k].to_numpy()[first] for k in self.keys[:n]})
+        groups['start'] = self.offsets[key][:-1]
+        groups['stop'] = self.offsets[key][1:]
+        return groups
+
+    def position(self, key):
+        # position of each sorted row in its group of key (as groupby(keys).cumcount() in the sorted order)
+        offsets = self.offsets[key]
+        return np.arange(len(self.order)) - np.repeat(offsets[:-1], np.diff(offsets))
+
+    def bounds(self, key, within):
+        # range of the groups of key in each group of within (a key before it), e.g. the bouts of each animal
+        return np.searchsorted(self.offsets[key], self.offsets[within])
+
+
+def sessions_table(df):
+    # Sessions of df (one row per animal in each session) and their per-trial times as flat arrays
+    # The trials are indexed in group -> session -> animal order (each in order of first appearance),
+    # with a contiguous block of trials (in recording order) for each animal in each session
+    index = TrialIndex(df, ['group', 'session_relative', 'animal'])
+    rows = index.order
+    offsets = index.offsets['animal']
+    trials = np.diff(offsets)
+    first = rows[offsets[:-1]]
+
+    # extract all trial start times, normalized to the last trial of the animal in the session
+    abs_times = df['trial_start'].to_numpy(dtype=float)[rows]
+    times = abs_times / np.repeat(abs_times[offsets[1:] - 1], trials)
+    medianTimes = pd.Series(times).groupby(np.repeat(np.arange(len(trials)), trials)).median().to_numpy()
+
+    # the session duration is taken from the first trial of the session (any animal), which is the first
+    # trial of its first animal
+    animals = np.diff(index.bounds('animal', 'session_relative'))
+    session_start = rows[np.repeat(index.offsets['session_relative'][:-1], animals)]
+    session_end = df['session_end'].to_numpy()[session_start]
+
+    sessions_df = pd.DataFrame(data={
+        'group': df['group'].to_numpy()[first],
+        'session': df['session_relative'].to_numpy()[first],
+        'duration': (session_end / 60000000).astype(int),
+        'animal': df['animal'].to_numpy()[first],
+        'trials': trials,
+        'medianTimes': medianTimes})
 
     sessions_df = sessions_df.sort_values(by=['group', 'animal', 'session']).reset_index()
+    order = sessions_df['index'].to_numpy()
+
+    # per-trial times of the sorted sessions as one flat array, session i spans offsets[i]:offsets[i + 1]
+    sorted_offsets = np.r_[0, np.cumsum(trials[order])]
+    flat = np.repeat(offsets[order] - sorted_offsets[:-1], trials[order]) + np.arange(len(rows))
+    trial_times = {'offsets': sorted_offsets,
+                   'times': times[flat],
+                   'abs_times': abs_times[flat]}
+    return sessions_df, trial_times
+
+
+def update_sessions_df(previous, touched, flat_times=False):
+    # Recompute the sessions touched by the rows appended to the curated data and splice them into the
+    # previous table, in the order (and with the 'index') that the full computation gives; with flat_times
+    # the table has no times (see get_session_times) and only the table is spliced
+    df = get_data(columns=data_columns['sessions'])
+    sessions = touched[['group', 'session_relative']].dropna().drop_duplicates()
+    if len(sessions) == 0:  # only trials without a session, which are not in the table
+        return previous
+
+    if flat_times:
+        old_df = previous
+    else:
+        old_df = previous.drop(columns=['times', 'abs_times'])
+        old_times = {'times': np.array([t for times in previous['times'] for t in times], dtype=float),
+                     'abs_times': np.array([t for times in previous['abs_times'] for t in times], dtype=float)}
+    old_offsets = np.r_[0, np.cumsum(old_df['trials'].to_numpy())]
+
+    new_df, new_times = sessions_table(df[partition_rows(df, sessions)])
+    keep = ~partition_rows(old_df.rename(columns={'session': 'session_relative'}), sessions)
+
+    # order of first appearance of the groups, sessions and animals ('index' sorts the table in that order):
+    # the previous partitions keep theirs and the new ones follow them
+    keys = ['group', 'session', 'animal']
+    first = pd.concat([old_df.sort_values('index')[keys], new_df.sort_values('index')[keys]], ignore_index=True)
+    for n, rank in enumerate(['group_rank', 'session_rank', 'animal_rank']):
+        first[rank] = first.groupby(keys[:n + 1], sort=False).ngroup()
+    first = first.drop_duplicates(keys)
+
+    sessions_df = pd.concat([old_df[keep].assign(start=old_offsets[:-1][keep]),
+                             new_df.assign(start=new_times['offsets'][:-1] + old_offsets[-1])],
+                            ignore_index=True)
+    sessions_df = sessions_df.merge(first, on=keys, how='left')
+    sessions_df = sessions_df.iloc[np.lexsort((sessions_df['animal_rank'], sessions_df['session_rank'],
+                                               sessions_df['group_rank']))]
+    sessions_df = sessions_df.drop(columns=['index', 'group_rank', 'session_rank', 'animal_rank'])
+    sessions_df = sessions_df.reset_index(drop=True).sort_values(by=['group', 'animal', 'session']).reset_index()
+
+    start = sessions_df.pop('start').to_numpy()
+    if flat_times:
+        return sessions_df
+
+    # gather the per-trial times of the spliced table from the previous and the recomputed ones
+    trials = sessions_df['trials'].to_numpy()
+    offsets = np.r_[0, np.cumsum(trials)]
+    flat = np.repeat(start - offsets[:-1], trials) + np.arange(offsets[-1])
+    trial_times = {'offsets': offsets,
+                   'times': np.concatenate([old_times['times'], new_times['times']])[flat],
+                   'abs_times': np.concatenate([old_times['abs_times'], new_times['abs_times']])[flat]}
+    return list_times(sessions_df, trial_times)
+
+
+def list_times(sessions_df, trial_times):
+    # Insert the per-trial times as lists in the 'times' and 'abs_times' columns
+    bounds = trial_times['offsets'][1:-1]
+    sessions_df.insert(6, 'times', [t.tolist() for t in np.split(trial_times['times'], bounds)])
+    sessions_df.insert(7, 'abs_times', [t.tolist() for t in np.split(trial_times['abs_times'], bounds)])
     return sessions_df
 
 
-def get_bayes():
-    data_model = data_path + 'MCI_BayesModel_LC_20230602.csv'
-    data_model = pd.read_csv(data_model, low_memory=False, sep=';', decimal=',')
-    data_model['animal'] = data_model['animal'].str[:2]
+@memoize(update=update_sessions_df)
+def get_sessions_df(flat_times=False):
+    # With flat_times=True the table has no per-trial times, which get_session_times() keeps in .npy files
+    sessions_df, trial_times = sessions_table(get_data(columns=data_columns['sessions']))
+    if flat_times:
+        return sessions_df
+    return list_times(sessions_df, trial_times)
 
-    data_points = data_path + 'MCI_BayesPoints_LC_20230602.csv'
-    data_points = pd.read_csv(data_points, low_memory=False, sep=';', decimal=',')
-    data_points['animal'] = data_points['animal'].str[:2]
-    groups_map = dict(zip(data_points.group.unique(), range(1, len(data_points.group.unique()) + 1)))
-    data_points = data_points.replace({'group': groups_map}).reset_index(drop=True)
 
-    data_sessions = data_path + 'MCI_BayesModelSessions_LC_20230612.csv'
-    data_sessions = pd.read_csv(data_sessions, low_memory=False, sep=';', decimal=',')
-    data_sessions['animal'] = data_sessions['animal'].str[:2]
+def get_session_times():
+    # Per-trial times of the sessions of get_sessions_df(flat_times=True): 'times' (normalized to the last trial)
+    # and 'abs_times' of all the trials in one array each, session i of the table spanning offsets[i]:offsets[i + 1].
+    # They are only stored as .npy files in memo_path (not in the pickle of the table), written once and
+    # memory-mapped (read only) afterwards, so that the sessions are read from the disk only when they are used,
+    # and split_times() gives views of them.
+    key = get_sessions_df.memo_key(flat_times=True)
+    if 'session_times_' + key in _memory:
+        return _memory['session_times_' + key]
 
-    return data_model, data_points, data_sessions
+    with stage('get_session_times') as s:
+        files = {name: "{}get_session_times_{}.{}.npy".format(memo_path, key, name)
+                 for name in ['offsets', 'times', 'abs_times']}
+        s.info['cache'] = 'disk'
+        if not all(os.path.exists(f) for f in files.values()):
+            s.info['cache'] = 'computed'
+            trial_times = sessions_table(get_data(columns=data_columns['sessions']))[1]
+            os.makedirs(memo_path, exist_ok=True)
+            for name, file in files.items():
+                tmp_file = "{}.{}.tmp".format(file, os.getpid())
+                with open(tmp_file, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(trial_times[name]))
+                os.replace(tmp_file, file)
+            evict_cache()
 
+        trial_times = {}
+        for name, file in files.items():
+            os.utime(file)  # mark as recently used
+            trial_times[name] = np.load(file, mmap_mode='r')
+        s.rows = len(trial_times['offsets']) - 1
+    _memory['session_times_' + key] = trial_times
+    return trial_times
 
-def get_performance():
-    df = get_data()
 
-    # The chance levels for stimuli of 5, 6, 7, 8, 9, and 10 degrees of visual angles on a screen
-    # at a distance of 24 cm are approximately 7.33%, 10.53%, 14.41%, 18.81%, 23.99%, and 30.24% respectively.
-    chance_map = dict(zip(sorted(df['size'].unique()), list([7.33, 10.53, 14.41, 18.81, 23.99, 30.24])))
+def split_times(trial_times, sessions=None, column='times'):
+    # Times of the sessions at the positions given (rows of the table of get_sessions_df, all of them by
+    # default) as views of the flat array of trial_times
+    offsets = trial_times['offsets']
+    values = trial_times[column]
+    if sessions is None:
+        sessions = range(len(offsets) - 1)
+    return [values[offsets[i]:offsets[i + 1]] for i in sessions]
+
+
+def iter_bouts_df(df, targets, binSize=10, minSize=10):
+    # targets maps each column to its categories, e.g. {'selection': tasks_order, 'selection_xpos': [-8, 0, 8]}
+    # Index the trials once by animal -> session -> bout (first appearance), keeping the recording order
+    index = TrialIndex(df, ['animal', 'session_relative', 'bout_ID'])
+    rows = index.order
+    starts = index.offsets['bout_ID'][:-1]
+    N = np.diff(index.offsets['bout_ID'])
+
+    # only bouts with a set change and at least minSize trials are included
+    setChange = (df['setChange_flag'].to_numpy()[rows] == 1).astype(int)
+    included = (np.add.reduceat(setChange, starts) > 0) & (N >= minSize)
+
+    animal_starts = index.bounds('bout_ID', 'animal')
+    values = {column: df[column].to_numpy() for column in targets}
+
+    for a0, a1 in zip(animal_starts[:-1], animal_starts[1:]):
+        bouts = a0 + np.flatnonzero(included[a0:a1])
+        if len(bouts) == 0:
+            continue
+
+        # trials of the included bouts of this animal and the bin each of them falls in
+        n = N[bouts]
+        first = np.r_[0, np.cumsum(n)[:-1]]
+        trials = rows[np.repeat(starts[bouts] - first, n) + np.arange(n.sum())]
+        bins = -(-n // binSize)
+        bin_start = np.r_[0, np.cumsum(bins)[:-1]]
+        bin_of_trial = np.repeat(bin_start, n) + (np.arange(n.sum()) - np.repeat(first, n)) // binSize
+
+        bout_rows = rows[starts[bouts]]
+        bins_df = pd.DataFrame(data={
+            'animal': np.repeat(df['animal'].to_numpy()[bout_rows], bins),
+            'session': np.repeat(df['session_relative'].to_numpy()[bout_rows], bins),
+            'bout': np.repeat(np.arange(1, len(bouts) + 1), bins),
+            'bin': (np.arange(bins.sum()) - np.repeat(bin_start, bins)) * binSize,
+            'group': np.repeat(df['group'].to_numpy()[bout_rows], bins),
+            'N': np.repeat(n, bins)})
+
+        # one row per bin and category, for every target column
+        tables = {}
+        for column, categories in targets.items():
+            proportion = np.column_stack([np.bincount(bin_of_trial, weights=values[column][trials] == c,
+                                                      minlength=bins.sum()) for c in categories]) / binSize
+            table = bins_df.loc[bins_df.index.repeat(len(categories))].reset_index(drop=True)
+            table.insert(4, 'proportion', proportion.ravel())
+            table.insert(5, column, np.tile(categories, bins.sum()))
+            tables[column] = table
+        yield tables
+
+
+@stage
+def get_bouts_df(df, targets, binSize=10, minSize=10):
+    bouts_df = {column: [] for column in targets}
+    for tables in iter_bouts_df(df, targets, binSize, minSize):
+        for column in targets:
+            bouts_df[column].append(tables[column])
+
+    for column in targets:
+        if len(bouts_df[column]) == 0:
+            bouts_df[column] = pd.DataFrame(columns=['animal', 'session', 'bout', 'bin', 'proportion', column,
+                                                     'group', 'N'])
+        else:
+            bouts_df[column] = pd.concat(bouts_df[column], ignore_index=True)
+    return bouts_df
+
+
+@stage
+def partial_corr(data, x, y, covar=None, by='animal'):
+    # Pearson correlation of x and y (partial, controlling for covar) for every group of `by`, computed
+    # from the grouped covariance matrices in one pass. It returns the n, r, CI95% and p-val columns of
+    # pingouin.partial_corr, with one row per group in order of first appearance.
+    from scipy import stats
+
+    by = [by] if isinstance(by, str) else list(by)
+    covar = [] if covar is None else [covar] if isinstance(covar, str) else list(covar)
+    columns = [x, y] + covar
+    data = data[by + columns].dropna(subset=columns)
+
+    codes = data.groupby(by, sort=False, observed=True).ngroup().to_numpy()
+    data, codes = data[codes >= 0], codes[codes >= 0]
+    first = np.unique(codes, return_index=True)[1]
+    n = np.bincount(codes)
+
+    # covariance matrix of every group, from the values centered on the group means
+    X = data[columns].to_numpy(dtype=float)
+    X = X - (np.stack([np.bincount(codes, weights=X[:, i]) for i in range(len(columns))], axis=1) / n[:, None])[codes]
+    V = np.empty((len(n), len(columns), len(columns)))
+    for i in range(len(columns)):
+        for j in range(i, len(columns)):
+            V[:, i, j] = V[:, j, i] = np.bincount(codes, weights=X[:, i] * X[:, j])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if covar:
+            Vi = np.linalg.pinv(V, hermitian=True)
+            r = -Vi[:, 0, 1] / np.sqrt(Vi[:, 0, 0] * Vi[:, 1, 1])
+        else:
+            r = V[:, 0, 1] / np.sqrt(V[:, 0, 0] * V[:, 1, 1])
+        r[n < 3] = np.nan
+
+        # p-value from the t distribution and CI from the Fisher z transform, as in pingouin
+        k = len(covar)
+        dof = n - k - 2
+        pval = 2 * stats.t.sf(np.abs(r * np.sqrt(dof / (1 - r ** 2))), dof)
+        z = np.arctanh(r)
+        se = 1 / np.sqrt(n - k - 3)
+        crit = np.abs(stats.norm.ppf(0.025))
+        ci = np.round(np.round(np.tanh(np.stack([z - crit * se, z + crit * se], axis=1)), 6), 2)
+
+    result = data[by].iloc[first].reset_index(drop=True)
+    result['n'] = n
+    result['r'] = r
+    result['CI95%'] = list(ci)
+    result['p-val'] = pval
+    return result
+
+
+@stage
+def resample_corr(data, x, y, covar=None, by='animal', n_boot=None, n_perm=None, seed=None, jobs=1):
+    # Bootstrap CI (percentile) and permutation p-value of the (partial) correlations of partial_corr, for
+    # every group of `by`. The bootstrap resamples the rows (e.g. sessions) of each group with replacement,
+    # the permutation shuffles y within each group, or with covar the residuals of y on covar (Freedman-Lane:
+    # y is replaced by its fitted values plus the shuffled residuals). All replicates of a block are drawn as
+    # one index matrix and their correlations computed at once; the blocks are seeded from seed (get_analysis
+    # by default), so that the results do not depend on jobs, the number of threads computing them.
+    # The CI95%_boot and p-perm columns are NaN when n_boot or n_perm is 0.
+    analysis = get_analysis()
+    n_boot = analysis['n_boot'] if n_boot is None else n_boot
+    n_perm = analysis['n_perm'] if n_perm is None else n_perm
+    seed = analysis['seed'] if seed is None else seed
+
+    by = [by] if isinstance(by, str) else list(by)
+    covar = [] if covar is None else [covar] if isinstance(covar, str) else list(covar)
+    columns = [x, y] + covar
+    data = data[by + columns].dropna(subset=columns)
+
+    # rows sorted by group (in order of first appearance), each group a contiguous range
+    codes = data.groupby(by, sort=False, observed=True).ngroup().to_numpy()
+    data, codes = data[codes >= 0], codes[codes >= 0]
+    order = np.argsort(codes, kind='stable')
+    X = data[columns].to_numpy(dtype=float)[order]
+    n = np.bincount(codes)
+    starts = np.r_[0, np.cumsum(n)[:-1]].astype(int)
+    if len(X) == 0:
+        return pd.DataFrame(columns=by + ['n', 'CI95%_boot', 'p-perm'])
+
+    r = _resampled_corr(X, starts, np.arange(len(X))[None, :], len(covar) > 0)[0]
+    blocks = _resample_blocks(X, starts, len(covar) > 0, n_boot, n_perm, seed)
+    if jobs > 1 and len(blocks) > 1:
+        # threads: numpy releases the GIL in the indexing, reductions and linear algebra of the blocks, and
+        # the figure scripts calling this are not guarded by __main__, as spawned processes would need
+        from concurrent.futures import ThreadPoolExecutor
 
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            replicates = list(pool.map(_resample_block, *zip(*blocks)))
+    else:
+        replicates = [_resample_block(*block) for block in blocks]
+
+    boot = [b for block, b in zip(blocks, replicates) if block[3] == 'boot']
+    perm = [p for block, p in zip(blocks, replicates) if block[3] == 'perm']
+    result = data[by].iloc[order[starts]].reset_index(drop=True)
+    result['n'] = n
+    result['CI95%_boot'] = np.nan
+    result['p-perm'] = np.nan
+    with warnings.catch_warnings():  # groups too small for a correlation
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if n_boot > 0:
+            ci = np.nanpercentile(np.concatenate(boot), [2.5, 97.5], axis=0).T
+            result['CI95%_boot'] = list(np.round(ci, 2))
+        if n_perm > 0:
+            # with a small tolerance, so that the permutations giving back the observed order are counted
+            extreme = (np.abs(np.concatenate(perm)) >= np.abs(r) - 1e-12).sum(axis=0)
+            result['p-perm'] = np.where(np.isnan(r), np.nan, (extreme + 1) / (n_perm + 1))
+    return result
+
+
+def _resample_blocks(X, starts, partial, n_boot, n_perm, seed, block_bytes=16 * 1024 ** 2):
+    # Arguments of _resample_block for blocks of replicates small enough to fit in block_bytes,
+    # each with its own child of the seed
+    size = max(1, block_bytes // (8 * X.size * X.shape[1]))
+    blocks = [(kind, min(size, total - i)) for kind, total in [('boot', n_boot), ('perm', n_perm)]
+              for i in range(0, total, size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    return [(X, starts, partial, kind, count, s) for (kind, count), s in zip(blocks, seeds)]
+
+
+def _resample_block(X, starts, partial, kind, count, seed):
+    # Correlations of count replicates: rows drawn with replacement within each group (kind='boot'),
+    # or y (its residuals on the covariates when partial) shuffled within each group (kind='perm')
+    rng = np.random.default_rng(seed)
+    n = np.diff(np.r_[starts, len(X)])
+    u = rng.random((count, len(X)))
+    if kind == 'boot':
+        return _resampled_corr(X, starts, np.repeat(starts, n) + (u * np.repeat(n, n)).astype(int), partial)
+
+    # sorting group code + uniform noise shuffles the rows within each group
+    index = np.argsort(np.repeat(np.arange(len(n)), n) + u, axis=1)
+    if partial:
+        fitted, residuals = _group_residuals(X, starts)
+        return _resampled_corr(X, starts, np.arange(len(X))[None, :], partial, y=fitted + residuals[index])
+    return _resampled_corr(X, starts, np.arange(len(X))[None, :], partial, y=X[index, 1])
+
+
+def _group_residuals(X, starts):
+    # Fitted values and residuals of the least squares fit (with intercept) of the second column of X on the
+    # columns after it, within each group of rows starting at starts
+    n = np.diff(np.r_[starts, len(X)])
+    Xc = X - np.repeat(np.add.reduceat(X, starts, axis=0) / n[:, None], n, axis=0)
+    C = Xc[:, 2:]
+    Vcc = np.add.reduceat(C[:, :, None] * C[:, None, :], starts, axis=0)
+    Vcy = np.add.reduceat(C * Xc[:, 1:2], starts, axis=0)
+    beta = np.einsum('gij,gj->gi', np.linalg.pinv(Vcc, hermitian=True), Vcy)
+    fitted = X[:, 1] - Xc[:, 1] + np.einsum('ri,ri->r', C, np.repeat(beta, n, axis=0))
+    return fitted, X[:, 1] - fitted
+
+
+def _resampled_corr(X, starts, index, partial, y=None):
+    # (Partial) correlation of the first two columns of X[index] (with y as second column when given, one row
+    # per replicate) in every group of rows starting at starts, for each row of the index matrices: an array
+    # (replicates, groups)
+    Xb = X[np.broadcast_to(index, (len(index) if y is None else len(y), X.shape[0]))]
+    if y is not None:
+        Xb[..., 1] = y
+    n = np.diff(np.r_[starts, len(X)])
+    Xb -= np.repeat(np.add.reduceat(Xb, starts, axis=1) / n[:, None], n, axis=1)
+    V = np.add.reduceat(Xb[..., :, None] * Xb[..., None, :], starts, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if partial:
+            Vi = np.linalg.pinv(V, hermitian=True)
+            r = -Vi[..., 0, 1] / np.sqrt(Vi[..., 0, 0] * Vi[..., 1, 1])
+        else:
+            r = V[..., 0, 1] / np.sqrt(V[..., 0, 0] * V[..., 1, 1])
+    r[(V[..., 0, 0] == 0) | (V[..., 1, 1] == 0)] = np.nan  # x or y constant in the replicate
+    r[:, n < 3] = np.nan
+    return r
+
+
+def bayes_sources():
+    # Content hashes of the bayesian exports in data_path and the schema they are validated against
+    files = [get_bayes_file(kind) for kind in bayes_files if any(Path(data_path).glob(bayes_files[kind]))]
+    return [bayes_schema] + [get_fingerprint(f) for f in files]
+
+
+@memoize(sources=bayes_sources)
+def get_bayes(animals=None, columns=None, level=None, dense=False):
+    # The model, points and sessions tables of the bayesian analysis (see read_bayes); columns gives the
+    # columns of each table ({'points': [...], ...}, all of them for the tables not in it). With a credible
+    # level (credible_level of get_analysis by default) the summaries of the model and sessions tables are
+    # recomputed from their posterior draws (see summarize_bayes). With dense=True the model table is also
+    # returned as an array (see model_array), after the three tables.
+    columns = {} if columns is None else columns
+    level = get_analysis()['credible_level'] if level is None else level
+    tables = []
+    for kind in ['model', 'points', 'sessions']:
+        stats = ['estimate', 'sd', 'lower_CI', 'upper_CI']
+        if level is None or kind + '_draws' not in bayes_files or (
+                columns.get(kind) is not None and not set(stats) & set(columns[kind])):
+            tables.append(read_bayes(kind, animals=animals, columns=columns.get(kind)))
+        else:
+            tables.append(summarize_bayes(kind, level, animals=animals, columns=columns.get(kind)))
+    if dense:
+        tables.append(model_array(tables[0]))
+    return tuple(tables)
+
+
+def model_array(data_model, stats=('estimate', 'lower_CI', 'upper_CI')):
+    # The stats of the model table as values[animal, selection, stat], with the animals in order of first
+    # appearance ('animals', a pd.Index to look them up), the selections in tasks_order and NaN where the
+    # table has no row, so that the estimates of an animal are fetched by indexing instead of masking the table
+    animals = pd.Index(pd.unique(data_model['animal']))
+    selections = pd.Index(tasks_order)
+    values = np.full((len(animals), len(selections), len(stats)), np.nan)
+    values[animals.get_indexer(data_model['animal']), selections.get_indexer(data_model['selection'])] = \
+        data_model[list(stats)].to_numpy(dtype=float)
+    return {'values': values, 'animals': animals, 'selections': selections, 'stats': list(stats)}
+
+
+def get_bayes_file(kind):
+    # The latest export of a kind of bayes_files, by the date (YYYYMMDD) in its name and then by name
+    files = [f.name for f in Path(data_path).glob(bayes_files[kind])]
+    if not files:
+        raise FileNotFoundError("no {} export ({}) in {}".format(kind, bayes_files[kind], data_path))
+    return data_path + max(files, key=lambda f: (re.findall(r'\d{8}', f)[-1:], f))
+
+
+@stage
+def read_bayes(kind, animals=None, columns=None):
+    # A table of the bayesian analysis, parsed and validated once and read from its parquet copy afterwards,
+    # with only the rows of the animals and the columns given (the filter is pushed down to parquet)
+    bayes_file = get_bayes_file(kind)
+    cache_file = get_cache_file(bayes_file, 'bayes')
+    df = None
+    if os.path.exists(cache_file):
+        try:
+            filters = None if animals is None else [('animal', 'in', list(animals))]
+            df = pd.read_parquet(cache_file, columns=None if columns is None else list(columns), filters=filters)
+        except ImportError:  # no parquet engine (pyarrow) installed
+            pass
+    if df is None:
+        df = read_cached(bayes_file, functools.partial(parse_bayes, kind=kind), kind='bayes')
+        if animals is not None:
+            df = df[df['animal'].isin(list(animals))]
+        if columns is not None:
+            df = df[list(columns)]
+    return validate_bayes(df.reset_index(drop=True), kind, bayes_file, columns)
+
+
+def parse_bayes(bayes_file, kind):
+    # Semicolon separated export with decimal commas; animals named by their first two letters and, in the
+    # points table, groups numbered in order of first appearance
+    df = pd.read_csv(bayes_file, low_memory=False, sep=';', decimal=',')
+    if 'animal' in df:
+        df['animal'] = df['animal'].str[:2]
+    if kind == 'points' and 'group' in df:
+        codes = pd.factorize(df['group'])[0]
+        df['group'] = np.where(codes >= 0, codes + 1, np.nan)
+    return validate_bayes(df, kind, bayes_file)
+
+
+def validate_bayes(df, kind, bayes_file, columns=None):
+    # Check the columns of bayes_schema[kind] (the ones in columns only, for a projection) and cast them to
+    # their kind: 'float' and 'int' columns must be numeric ('int' ones whole numbers without missing values),
+    # 'str' ones without missing values, and the tasks must be those of tasks_order. It returns the cast copy of df.
+    df = df.copy(deep=False)
+    schema = {c: t for c, t in bayes_schema[kind].items() if columns is None or c in columns}
+    missing = [c for c in schema if c not in df]
+    if missing:
+        raise ValueError("{}: missing columns {}".format(bayes_file, ', '.join(missing)))
+
+    for column in schema:
+        values = df[column]
+        if schema[column] == 'str':
+            if values.isna().any():
+                raise ValueError("{}: missing values in '{}'".format(bayes_file, column))
+            continue
+
+        if not pd.api.types.is_numeric_dtype(values):
+            # e.g. numbers read as strings: converted, unless some value is not a number
+            numbers = pd.to_numeric(values, errors='coerce')
+            bad = values[values.notna() & numbers.isna()]
+            if len(bad) > 0:
+                raise ValueError("{}: '{}' is not numeric (e.g. '{}')".format(bayes_file, column, bad.iloc[0]))
+            values = numbers.astype('float64')
+        if schema[column] == 'int':
+            if values.isna().any() or (values != np.round(values)).any():
+                raise ValueError("{}: '{}' has missing or non-integer values".format(bayes_file, column))
+            df[column] = values.astype('int64')
+        else:
+            df[column] = values.astype('float64')
+
+    if 'selection' in df and not df['selection'].isin(tasks_order).all():
+        unknown = sorted(set(df['selection']) - set(tasks_order))
+        raise ValueError("{}: unknown tasks in 'selection': {}".format(bayes_file, ', '.join(map(str, unknown))))
+    return df
+
+
+def summarize_bayes(kind, level, animals=None, columns=None):
+    # The rows of the table of kind with their estimate (posterior mean), sd and lower_CI / upper_CI (central
+    # credible interval at level) summarized from the draws of kind + '_draws' (see summarize_draws); the
+    # summary of the draws is stored as parquet next to the other copies, once for every level
+    if not 0 < level < 1:
+        raise ValueError("credible level {} is not between 0 and 1".format(level))
+    draw_file = get_bayes_file(kind + '_draws')
+    keys = [c for c in bayes_schema[kind + '_draws'] if c != 'value']
+    summary = read_cached(draw_file, functools.partial(summarize_draws, kind=kind + '_draws', level=level),
+                          kind='summary{:g}'.format(level * 100))
+
+    table = read_bayes(kind, animals=animals)
+    stats = ['estimate', 'sd', 'lower_CI', 'upper_CI']
+    order = list(table.columns) + [c for c in stats if c not in table]
+    table = table.drop(columns=[c for c in stats if c in table]).merge(summary[keys + stats], on=keys, how='left')
+    if table['estimate'].isna().any():
+        missing = table.loc[table['estimate'].isna(), keys].iloc[0].tolist()
+        raise ValueError("{}: no draws for {} {}".format(draw_file, ', '.join(keys), missing))
+    return validate_bayes(table[order if columns is None else list(columns)], kind, draw_file, columns)
+
+
+@stage
+def summarize_draws(draw_file, kind, level=0.95, chunksize=None, compression=None):
+    # Mean, sd and central credible interval at level of the draws ('value') of every group of the other columns
+    # of bayes_schema[kind], with the number of draws, reading the export in blocks of chunksize rows: the means
+    # and sums of squares are merged block by block (Chan et al.) and the quantiles are taken from a
+    # QuantileSketch of each group, so that only one block of draws is in memory at a time
+    keys = [c for c in bayes_schema[kind] if c != 'value']
+    chunksize = draws_chunk_rows if chunksize is None else chunksize
+    groups = {}  # key values -> position in n, mean, m2 and sketches
+    n, mean, m2 = np.zeros(0), np.zeros(0), np.zeros(0)
+    sketches = []
+
+    for chunk in pd.read_csv(draw_file, sep=';', decimal=',', usecols=keys + ['value'], chunksize=chunksize):
+        chunk['animal'] = chunk['animal'].str[:2]
+        chunk = validate_bayes(chunk, kind, draw_file)
+        grouped = chunk.groupby(keys, sort=False)['value']
+        block = grouped.agg(['count', 'mean', 'var'])
+
+        ids = np.array([groups.setdefault(key, len(groups)) for key in block.index])
+        new = len(groups) - len(n)
+        n, mean, m2 = np.r_[n, np.zeros(new)], np.r_[mean, np.zeros(new)], np.r_[m2, np.zeros(new)]
+        sketches += [QuantileSketch(draws_compression if compression is None else compression) for _ in range(new)]
+
+        count = block['count'].to_numpy(dtype=float)
+        total = n[ids] + count
+        delta = block['mean'].to_numpy() - mean[ids]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.where(total > 0, count / total, 0)
+        m2[ids] += np.nan_to_num(block['var'].to_numpy() * (count - 1)) + delta ** 2 * n[ids] * step
+        mean[ids] += np.nan_to_num(delta * step)
+        n[ids] = total
+        for key, values in grouped:
+            sketches[groups[key]].update(values.to_numpy())
+
+    summary = pd.DataFrame(list(groups), columns=keys)
+    summary['estimate'] = np.where(n > 0, mean, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary['sd'] = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+    bounds = np.array([s.quantile([(1 - level) / 2, (1 + level) / 2]) for s in sketches]).reshape(-1, 2)
+    summary['lower_CI'] = bounds[:, 0]
+    summary['upper_CI'] = bounds[:, 1]
+    summary['draws'] = n.astype(int)
+    return summary
+
+
+class QuantileSketch:
+    # Merging t-digest of a stream of values: the values are kept as at most about compression / 2 centroids
+    # (mean and weight), with the clusters bounded by the arcsine scale function so that they are small in the
+    # tails (where the bounds of the credible intervals are) and large around the median, and the exact
+    # minimum and maximum. Quantiles are interpolated between the centroids.
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        return int(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        means = np.r_[self.means, values]
+        weights = np.r_[self.weights, np.ones(len(values))]
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        # the centroids and values whose middle quantile falls in the same unit of the scale k(q) are merged
+        cum = np.cumsum(weights)
+        q = (cum - weights / 2) / cum[-1]
+        cluster = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)).astype(int)
+        cluster -= cluster[0]
+        totals = np.bincount(cluster, weights)
+        used = totals > 0
+        self.means = np.bincount(cluster, weights * means)[used] / totals[used]
+        self.weights = totals[used]
+
+    def quantile(self, q):
+        if len(self.weights) == 0:
+            return np.full(np.shape(q), np.nan)
+        cum = np.cumsum(self.weights)
+        centers = (cum - self.weights / 2) / cum[-1]
+        return np.interp(q, np.r_[0, centers, 1], np.r_[self.min, self.means, self.max])
+
+
+def hit_rates(df):
+    # Trials and hits per animal, session and size in the static task, and per group, animal, session,
+    # size and speed in the dynamic task
     # First compute performance for the Static Task
     temp = df[['animal', 'session_relative', 'selection', 'size', 'outcome']]
     temp = temp[temp['outcome'] != 'picture']  # Remove faulty outcomes
     temp = temp[temp['selection'] != 'pictures']  # Only consider static task
 
-    static_df = temp.groupby(['animal', 'session_relative', 'size'])['outcome'].count().reset_index()
-    static_df['hits'] = 0
-    for i in range(0, len(static_df)):
-        static_df.loc[i, 'hits'] = len(temp[(temp['animal'] == static_df.loc[i, 'animal']) &
-                                            (temp['session_relative'] == static_df.loc[i, 'session_relative']) &
-                                            (temp['size'] == static_df.loc[i, 'size']) &
-                                            (temp['outcome'] == 'hit')])
+    temp = temp.assign(hits=temp['outcome'] == 'hit')
+    static_df = temp.groupby(['animal', 'session_relative', 'size'], observed=True).agg(
+        total=('outcome', 'count'), hits=('hits', 'sum')).reset_index()
 
-    static_df = static_df.rename(columns={'outcome': 'total'})
     static_df['HR'] = static_df['hits'] / static_df['total']
-    static_df['chance'] = static_df['size']
-    static_df = static_df.replace({'chance': chance_map}).reset_index(drop=True)
-    static_df['chance'] /= 100
-    static_df['wHR'] = static_df['HR'] - static_df['chance']
 
     # Then compute performance for the Dynamic Task
     temp = df[['group', 'animal', 'session_relative', 'selection', 'speed', 'size', 'outcome']]
     temp = temp[temp['outcome'] != 'picture']  # Remove faulty outcomes
     temp = temp[temp['selection'] == 'dynamic']  # Only consider static task
 
-    dynamic_df = temp.groupby(['group', 'animal', 'session_relative', 'size', 'speed'])['outcome'].count().reset_index()
-    dynamic_df['hits'] = 0
-
-    for i in range(0, len(dynamic_df)):
-        dynamic_df.loc[i, 'hits'] = len(temp[(temp['animal'] == dynamic_df.loc[i, 'animal']) &
-                                             (temp['session_relative'] == dynamic_df.loc[i, 'session_relative']) &
-                                             (temp['speed'] == dynamic_df.loc[i, 'speed']) &
-                                             (temp['size'] == dynamic_df.loc[i, 'size']) &
-                                             (temp['outcome'] == 'hit')])
+    temp = temp.assign(hits=temp['outcome'] == 'hit')
+    dynamic_df = temp.groupby(['group', 'animal', 'session_relative', 'size', 'speed'], observed=True).agg(
+        total=('outcome', 'count'), hits=('hits', 'sum')).reset_index()
 
-    dynamic_df = dynamic_df.rename(columns={'outcome': 'total'})
     dynamic_df['HR'] = dynamic_df['hits'] / dynamic_df['total']
-    dynamic_df['chance'] = dynamic_df['size']
-    dynamic_df = dynamic_df.replace({'chance': chance_map}).reset_index(drop=True)
+    return static_df, dynamic_df
+
+
+def stimulus_area(size, distance=None):
+    # Area (cm2) on the screen of a round stimulus of size degrees of visual angle at the viewing distance
+    distance = viewing_distance if distance is None else distance
+    return np.pi * (distance * np.tan(np.radians(size) / 2)) ** 2
+
+
+@functools.lru_cache(maxsize=None)
+def _size_chance(size, distance, measured, measured_at):
+    # Chance level (%) of one stimulus size: the measured one (measured: (size, chance) pairs at the distance
+    # measured_at), or the area of the stimulus relative to the area on the screen that makes the measured
+    # chance levels proportional to the stimulus areas
+    measured = dict(measured)
+    if distance == measured_at and size in measured:
+        return measured[size]
+    sizes = np.array(list(measured), dtype=float)
+    areas = stimulus_area(sizes, measured_at)
+    response_area = 100 * (areas ** 2).sum() / (areas * np.array(list(measured.values()))).sum()
+    return float(100 * stimulus_area(size, distance) / response_area)
+
+
+def chance_level(size, distance=None):
+    # Chance level (%) of every stimulus size of an array (e.g. a column of sizes), computed once per distinct
+    # size and mapped back to the array; the settings are passed to _size_chance so that they key its cache
+    distance = viewing_distance if distance is None else distance
+    measured = tuple(sorted(measured_chance.items()))
+    sizes, inverse = np.unique(np.asarray(size), return_inverse=True)
+    values = np.array([_size_chance(s.item(), distance, measured, measured_distance) for s in sizes], dtype=float)
+    return values[inverse].reshape(np.shape(size))
+
+
+def chance_levels(static_df, dynamic_df):
+    # Hit rates adjusted by the chance level of the stimulus size (wHR), and sweet spot of each animal
+    static_df = static_df.reset_index(drop=True)
+    static_df['chance'] = chance_level(static_df['size'].to_numpy()) / 100
+    static_df['wHR'] = static_df['HR'] - static_df['chance']
+
+    dynamic_df = dynamic_df.reset_index(drop=True)
+    dynamic_df['chance'] = chance_level(dynamic_df['size'].to_numpy())
     dynamic_df['wHR'] = dynamic_df['HR'] - (dynamic_df['chance'] / 100)
 
     # Compute sweet spot
-    psycho_df = dynamic_df.groupby(['animal', 'size', 'speed'])[['total', 'hits']].sum().reset_index()
+    psycho_df = dynamic_df.groupby(['animal', 'size', 'speed'], observed=True)[['total', 'hits']].sum().reset_index()
     psycho_df['HR'] = psycho_df['hits'] / psycho_df['total']
-    chance_map = dict(zip(sorted(df['size'].unique()), list([7.33, 10.53, 14.41, 18.81, 23.99, 30.24])))
-    psycho_df['chance'] = psycho_df['size']
-    psycho_df = psycho_df.replace({'chance': chance_map}).reset_index(drop=True)
-    psycho_df['chance'] /= 100
+    psycho_df['chance'] = chance_level(psycho_df['size'].to_numpy()) / 100
     psycho_df['wHR'] = psycho_df['HR'] - psycho_df['chance']
 
-    psycho_df = psycho_df.loc[psycho_df.groupby('animal')['wHR'].idxmax(), ['animal', 'speed', 'size']]
+    psycho_df = psycho_df.loc[psycho_df.groupby('animal', observed=True)['wHR'].idxmax(), ['animal', 'speed', 'size']]
     # sns.lineplot(data=psycho_df, x='speed', y='wHR')
     # sns.histplot(data=result, x='speed')
 
     return static_df, dynamic_df, psycho_df
 
+
+def update_performance(previous, touched):
+    # Recompute the hit rates of the (animal, session) pairs touched by the rows appended to the curated
+    # data, splice them into the previous tables and adjust all of them by chance
+    df = get_data(columns=data_columns['performance'])
+    static_df, dynamic_df = [table.drop(columns=['chance', 'wHR']) for table in previous[:2]]
+    sessions = touched[['animal', 'session_relative']].dropna().drop_duplicates()
+    if len(sessions) > 0:
+        new_static, new_dynamic = hit_rates(df[partition_rows(df, sessions)])
+        static_df = splice_rows(static_df, new_static, sessions, ['animal', 'session_relative', 'size'], df)
+        dynamic_df = splice_rows(dynamic_df, new_dynamic, sessions,
+                                 ['group', 'animal', 'session_relative', 'size', 'speed'], df)
+    return chance_levels(static_df, dynamic_df)
+
+
+def splice_rows(previous, new, partitions, keys, df):
+    # Replace the rows of the previous table in the partitions by the new rows, in the order of a groupby
+    # on keys and with the categories of the columns of df
+    table = pd.concat([previous[~partition_rows(previous, partitions)], new], ignore_index=True)
+    for c in keys:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            table[c] = table[c].astype(df[c].dtype)
+    return table.sort_values(by=keys).reset_index(drop=True)
+
+
+@memoize(update=update_performance)
+def get_performance():
+    df = get_data(columns=data_columns['performance'])
+    static_df, dynamic_df = hit_rates(df)
+    return chance_levels(static_df, dynamic_df)
+
+
+@memoize
+def get_sweet_spots(n_resamples=None, seed=None):
+    # Stability of the sweet spot of each animal (psycho_df of get_performance): the hits of every animal x size
+    # x speed cell are drawn n_resamples times from a binomial with the trials and hit rate of the cell (the
+    # trials of the cell resampled), and the sweet spot is picked again in every replicate, as the first cell
+    # of the animal with the highest wHR (as idxmax). It returns the cells picked in at least one replicate,
+    # with the number and proportion of replicates picking them and the observed sweet spot flagged.
+    analysis = get_analysis()
+    n_resamples = analysis['n_boot'] if n_resamples is None else n_resamples
+    seed = analysis['seed'] if seed is None else seed
+
+    _, dynamic_df, psycho_df = get_performance()
+    cells = dynamic_df.groupby(['animal', 'size', 'speed'], observed=True).agg(
+        total=('total', 'sum'), hits=('hits', 'sum'), chance=('chance', 'first')).reset_index()
+    total = cells['total'].to_numpy()
+    chance = cells['chance'].to_numpy() / 100
+
+    # the cells of an animal are contiguous (groupby order): first cell with the highest wHR of each animal
+    starts = np.flatnonzero(np.r_[True, cells['animal'].to_numpy()[1:] != cells['animal'].to_numpy()[:-1]])
+    n = np.diff(np.r_[starts, len(cells)])
+    rng = np.random.default_rng(seed)
+    wHR = rng.binomial(total, cells['hits'].to_numpy() / total, size=(n_resamples, len(cells))) / total - chance
+    best = np.maximum.reduceat(wHR, starts, axis=1)
+    first = np.where(wHR == np.repeat(best, n, axis=1), np.arange(len(cells)), len(cells))
+    picks = np.minimum.reduceat(first, starts, axis=1)
+
+    replicates = np.bincount(picks.ravel(), minlength=len(cells))
+    spots = cells.loc[replicates > 0, ['animal', 'size', 'speed']].reset_index(drop=True)
+    spots['replicates'] = replicates[replicates > 0]
+    spots['proportion'] = spots['replicates'] / n_resamples
+    observed = pd.MultiIndex.from_frame(psycho_df[['animal', 'size', 'speed']])
+    spots['observed'] = pd.MultiIndex.from_frame(spots[['animal', 'size', 'speed']]).isin(observed)
+    return spots
+
+
 #
 # def get_RT():
 #     # Compute performance adjusted by the chance level and the reaction time
@@ -300,4 +2052,29 @@ def get_performance():
 #     RT_df = RT_df.replace({'chance': chance_map}).reset_index(drop=True)
 #     RT_df['wHR'] = RT_df['HR'] - (RT_df['chance'] / 100)
 #
-#     return RT_df
\ No newline at end of file
+#     return RT_df
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Utilities of the MCI analysis')
+    commands = parser.add_subparsers(dest='command', required=True)
+    cache = commands.add_parser('cache', help='inspect or clear the cache of the derived tables')
+    cache.add_argument('action', choices=['info', 'clear'])
+    cache.add_argument('--data', action='store_true', help='also remove the parquet copies of the exports')
+    memory = commands.add_parser('memory', help='report the memory of the data columns with and without data_schema')
+    memory.add_argument('--raw', action='store_true', help='of the raw data (Figure S2) instead of the curated data')
+    args = parser.parse_args()
+
+    if args.command == 'memory':
+        reader = read_raw_data if args.raw else read_data
+        report = memory_report(reader(get_data_file(), compact=False))
+        print(report.to_string(index=False, float_format='{:.2f}'.format))
+        sys.exit()
+
+    if args.action == 'clear':
+        clear_cache(data=args.data)
+    info = get_cache_info()
+    print(info.to_string(index=False))
+    print("{:.1f} of {:.1f} MB used".format(info['size_MB'].sum(), cache_size / 1024 ** 2))
@@ -0,0 +1,149 @@
+"""
+Pipeline runner of the MCI project: it builds the figures from one in-memory dataset.
+
+    python anc_MCI_pipeline.py run --figures 2,3,4,S1,S2 [--jobs 8] [--render tables]
+    python anc_MCI_pipeline.py list
+
+- tables
+    the shared tables, with the tables they are derived from and the function computing them (called with
+    the same arguments as in the figure scripts, so that they find the results already memoized)
+
+- figures
+    the figure scripts, with the tables each of them needs
+
+The tables needed by the requested figures are computed once, in dependency order, and the figure
+scripts are then executed in this process, where get_data() and the memoized get_* functions of
+anc_MCI_configuration return the tables already computed instead of loading and deriving them again.
+
+With --jobs N the figure scripts run in a pool of N processes. The large dataframes (shared_tables)
+are written once to an Arrow file that every worker memory-maps, the derived tables are read from
+the disk cache of conf.memoize (the per-session trial times memory-mapped from their .npy files, see
+conf.get_session_times), and plots are rendered with the Agg backend.
+
+With --render tables the figure scripts only write their tables, and with --render deferred they draw
+(with the Agg backend) only the panels saved as pdf, once their tables are written (see conf.render).
+
+The stages of the run are traced (see conf.stage): the shared tables in results/pipeline_trace.*,
+and every figure script in results/Figure_<n>_trace.* (with MCI_PROFILE set, also profiled).
+
+author acalapai@dpz.eu
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from graphlib import TopologicalSorter
+import argparse
+import functools
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+import anc_MCI_configuration as conf
+
+tables = {'data': ([], conf.get_data),
+          'raw_data': ([], conf.get_raw_data),
+          'sessions': (['data'], functools.partial(conf.get_sessions_df, flat_times=True)),
+          'session_times': (['data'], conf.get_session_times),
+          'performance': (['data'], conf.get_performance),
+          'bayes_3': ([], functools.partial(conf.get_bayes, columns=conf.bayes_columns['Figure_3'], dense=True)),
+          'bayes_S1': ([], functools.partial(conf.get_bayes, columns=conf.bayes_columns['Figure_S1']))}
+
+figures = {'2': ('anc_MCI_Figure_2.py', ['data', 'sessions', 'session_times']),
+           '3': ('anc_MCI_Figure_3_v2.py', ['bayes_3']),
+           '4': ('anc_MCI_Figure_4.py', ['data', 'performance']),
+           'S1': ('anc_MCI_Figure_S1.py', ['bayes_S1']),
+           'S2': ('anc_MCI_Figure_S2.py', ['raw_data'])}
+
+# Tables passed to the worker processes through memory-mapped Arrow files
+shared_tables = ['data', 'raw_data']
+
+
+def get_graph(figure_list):
+    # Dependency graph of the requested figures and of the tables they need (directly or not)
+    graph = {}
+    pending = []
+    for f in figure_list:
+        graph['Figure_' + f] = set(figures[f][1])
+        pending += figures[f][1]
+
+    while pending:
+        t = pending.pop()
+        if t not in graph:
+            graph[t] = set(tables[t][0])
+            pending += tables[t][0]
+    return graph
+
+
+def run_figure(f):
+    start = time.perf_counter()
+    runpy.run_path(figures[f][0], run_name='__main__')
+    # pyplot is only imported by the scripts drawing their panels (not with --render tables)
+    if 'matplotlib.pyplot' in sys.modules:
+        sys.modules['matplotlib.pyplot'].close('all')
+    return 'Figure_' + f, time.perf_counter() - start
+
+
+def init_worker(shared):
+    # Seed the in-memory cache of the worker with the memory-mapped tables of the parent process; the backend
+    # is set for when matplotlib is imported, since nothing has imported it yet in the (spawned) worker
+    os.environ['MPLBACKEND'] = 'Agg'
+    for t, path in shared.items():
+        conf._memory[tables[t][1].memo_key()] = conf.read_shared(path)
+
+
+def run(figure_list, jobs=1, render=None):
+    if render is not None:
+        # the worker processes read the render mode from the environment when they import conf
+        conf.render = os.environ['MCI_RENDER'] = render
+
+    order = list(TopologicalSorter(get_graph(figure_list)).static_order())
+    for t in [node for node in order if node in tables]:
+        start = time.perf_counter()
+        tables[t][1]()
+        print("{:<14}{:8.2f} s".format(t, time.perf_counter() - start))
+
+    shared = {}
+    if jobs > 1:
+        for t in [t for t in shared_tables if t in order]:
+            path = conf.share_data(tables[t][1](), t)
+            if path is not None:
+                shared[t] = path
+    # the shared tables as the run 'pipeline', the figure scripts write the trace of their own run
+    conf.write_trace('pipeline')
+
+    if jobs == 1:
+        for f in figure_list:
+            print("{:<14}{:8.2f} s".format(*run_figure(f)))
+        return
+
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(shared,)) as pool:
+            for job in as_completed([pool.submit(run_figure, f) for f in figure_list]):
+                print("{:<14}{:8.2f} s".format(*job.result()))
+    finally:
+        for path in shared.values():
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the figures of the MCI project')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='compute the shared tables once and run the figure scripts')
+    run_parser.add_argument('--figures', default=','.join(figures),
+                            help='comma separated list of figures (default: {})'.format(','.join(figures)))
+    run_parser.add_argument('--jobs', type=int, default=1,
+                            help='number of worker processes for the figure scripts (default: 1)')
+    run_parser.add_argument('--render', choices=conf.render_modes,
+                            help='render mode of the figure panels (default: conf.render)')
+    commands.add_parser('list', help='show the figures and the tables they need')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for f, (script, needs) in figures.items():
+            print("{:<4}{:<26}{}".format(f, script, ', '.join(needs)))
+    else:
+        figure_list = [f.strip() for f in args.figures.split(',')]
+        unknown = [f for f in figure_list if f not in figures]
+        if unknown:
+            parser.error("unknown figures: {}".format(', '.join(unknown)))
+        run(figure_list, jobs=args.jobs, render=args.render)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The analysis modules are scripts at the root of the repository, which they read their data from
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
@@ -0,0 +1,37 @@
+"""
+Tests of the validation of the tables of the bayesian analysis (validate_bayes).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import anc_MCI_configuration as conf
+
+
+def model_table(**columns):
+    table = {'animal': ['al'], 'selection': ['static'], 'estimate': [0.5], 'sd': [0.1],
+             'lower_CI': [0.3], 'upper_CI': [0.7]}
+    table.update(columns)
+    return pd.DataFrame(table)
+
+
+def test_numeric_strings_are_converted():
+    df = conf.validate_bayes(model_table(estimate=pd.Series(['0.5'], dtype=object)), 'model', 'model.csv')
+    assert df['estimate'].dtype == 'float64'
+    assert df['estimate'].iloc[0] == 0.5
+
+
+def test_missing_values_in_an_object_column_are_kept():
+    df = conf.validate_bayes(model_table(sd=pd.Series([None], dtype=object)), 'model', 'model.csv')
+    assert df['sd'].dtype == 'float64'
+    assert np.isnan(df['sd'].iloc[0])
+
+
+def test_non_numeric_values_are_rejected():
+    with pytest.raises(ValueError, match="'estimate' is not numeric"):
+        conf.validate_bayes(model_table(estimate=['high']), 'model', 'model.csv')
+
+
+def test_int_columns_from_strings():
+    table = pd.DataFrame({'animal': ['al'], 'selection': ['dynamic'], 'session': pd.Series(['3'], dtype=object),
+                          'estimate': [0.5], 'trials': [10]})
+    assert conf.validate_bayes(table, 'sessions', 'sessions.csv')['session'].dtype == 'int64'
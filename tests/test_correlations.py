@@ -0,0 +1,51 @@
+"""
+Tests of the per-group correlations of partial_corr and of their resampling (resample_corr).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import anc_MCI_configuration as conf
+
+
+def synthetic_groups(seed=0):
+    # Three groups of 30 rows, y correlated with x and with the covariate c
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'animal': np.repeat(['al', 'ba', 'ca'], 30), 'x': rng.normal(size=90),
+                       'c': rng.normal(size=90)})
+    df['y'] = 2 * df['c'] + np.repeat([0, 0.3, 0.8], 30) * df['x'] + rng.normal(size=90)
+    return df
+
+
+def test_resample_corr_without_replicates():
+    result = conf.resample_corr(synthetic_groups(), x='x', y='y', covar='c', n_boot=0, n_perm=0)
+    assert list(result.columns) == ['animal', 'n', 'CI95%_boot', 'p-perm']
+    assert result[['CI95%_boot', 'p-perm']].isna().all().all()
+
+
+def test_group_residuals_match_least_squares():
+    df = synthetic_groups()
+    X = df[['x', 'y', 'c']].to_numpy()
+    starts = np.array([0, 30, 60])
+    fitted, residuals = conf._group_residuals(X, starts)
+    for start in starts:
+        rows = slice(start, start + 30)
+        A = np.c_[np.ones(30), X[rows, 2]]
+        beta = np.linalg.lstsq(A, X[rows, 1], rcond=None)[0]
+        np.testing.assert_allclose(fitted[rows], A @ beta)
+        np.testing.assert_allclose(residuals[rows], X[rows, 1] - A @ beta)
+
+
+@pytest.mark.parametrize('covar', [None, 'c'])
+def test_partial_corr_matches_pingouin(covar):
+    pg = pytest.importorskip('pingouin')
+    df = synthetic_groups()
+    result = conf.partial_corr(df, x='x', y='y', covar=covar, by='animal')
+
+    for row in result.itertuples(index=False):
+        expected = pg.partial_corr(data=df[df['animal'] == row.animal], x='x', y='y', covar=covar)
+        # the columns are named p_val and CI95 from pingouin 0.7
+        expected = expected.rename(columns={'p_val': 'p-val', 'CI95': 'CI95%'}).iloc[0]
+        assert row.n == expected['n']
+        np.testing.assert_allclose(row.r, expected['r'], atol=1e-10)
+        np.testing.assert_allclose(row[4], expected['p-val'], rtol=1e-8, atol=1e-12)
+        np.testing.assert_allclose(row[3], expected['CI95%'])
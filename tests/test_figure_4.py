@@ -0,0 +1,115 @@
+"""
+Regression tests of the hit rates of Figure 4: the aggregations of hit_rates / get_performance against the
+per-group loops they replaced, on a synthetic trial table, and the tables of results/Figure_4*.csv against
+the curated data, when the data is present.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import anc_MCI_configuration as conf
+
+
+def synthetic_data(n=3000, seed=0):
+    # Trials of six animals in two groups, with every task, stimulus size and outcome
+    rng = np.random.default_rng(seed)
+    animals = np.array(['al', 'cl', 'ba', 'ni', 'ca', 'sa'])
+    animal = rng.choice(animals, n)
+    df = pd.DataFrame({'group': np.where(np.isin(animal, animals[:3]), 1, 2),
+                       'animal': animal,
+                       'session_relative': rng.integers(1, 7, n),
+                       'selection': rng.choice(['static', 'dynamic', 'pictures'], n, p=[0.4, 0.5, 0.1]),
+                       'size': rng.integers(5, 11, n),
+                       'speed': rng.integers(10, 21, n),
+                       'outcome': rng.choice(['hit', 'wrong', 'ignored', 'picture'], n, p=[0.6, 0.2, 0.15, 0.05])})
+    return conf.compact_data(df)
+
+
+def loop_performance(df):
+    # get_performance as it was computed before the aggregations: one mask over the trials per row
+    chance_map = dict(zip(sorted(df['size'].unique()), list([7.33, 10.53, 14.41, 18.81, 23.99, 30.24])))
+
+    temp = df[['animal', 'session_relative', 'selection', 'size', 'outcome']]
+    temp = temp[temp['outcome'] != 'picture']
+    temp = temp[temp['selection'] != 'pictures']
+
+    static_df = temp.groupby(['animal', 'session_relative', 'size'], observed=True)['outcome'].count().reset_index()
+    static_df['hits'] = 0
+    for i in range(0, len(static_df)):
+        static_df.loc[i, 'hits'] = len(temp[(temp['animal'] == static_df.loc[i, 'animal']) &
+                                            (temp['session_relative'] == static_df.loc[i, 'session_relative']) &
+                                            (temp['size'] == static_df.loc[i, 'size']) &
+                                            (temp['outcome'] == 'hit')])
+    static_df = static_df.rename(columns={'outcome': 'total'})
+    static_df['HR'] = static_df['hits'] / static_df['total']
+    static_df['chance'] = static_df['size'].map(chance_map).astype(float) / 100
+    static_df['wHR'] = static_df['HR'] - static_df['chance']
+
+    temp = df[['group', 'animal', 'session_relative', 'selection', 'speed', 'size', 'outcome']]
+    temp = temp[temp['outcome'] != 'picture']
+    temp = temp[temp['selection'] == 'dynamic']
+
+    dynamic_df = temp.groupby(['group', 'animal', 'session_relative', 'size', 'speed'],
+                              observed=True)['outcome'].count().reset_index()
+    dynamic_df['hits'] = 0
+    for i in range(0, len(dynamic_df)):
+        dynamic_df.loc[i, 'hits'] = len(temp[(temp['animal'] == dynamic_df.loc[i, 'animal']) &
+                                             (temp['session_relative'] == dynamic_df.loc[i, 'session_relative']) &
+                                             (temp['speed'] == dynamic_df.loc[i, 'speed']) &
+                                             (temp['size'] == dynamic_df.loc[i, 'size']) &
+                                             (temp['outcome'] == 'hit')])
+    dynamic_df = dynamic_df.rename(columns={'outcome': 'total'})
+    dynamic_df['HR'] = dynamic_df['hits'] / dynamic_df['total']
+    dynamic_df['chance'] = dynamic_df['size'].map(chance_map).astype(float)
+    dynamic_df['wHR'] = dynamic_df['HR'] - (dynamic_df['chance'] / 100)
+
+    psycho_df = dynamic_df.groupby(['animal', 'size', 'speed'], observed=True)[['total', 'hits']].sum().reset_index()
+    psycho_df['HR'] = psycho_df['hits'] / psycho_df['total']
+    psycho_df['chance'] = psycho_df['size'].map(chance_map).astype(float) / 100
+    psycho_df['wHR'] = psycho_df['HR'] - psycho_df['chance']
+    psycho_df = psycho_df.loc[psycho_df.groupby('animal', observed=True)['wHR'].idxmax(), ['animal', 'speed', 'size']]
+    return static_df, dynamic_df, psycho_df
+
+
+def assert_same_table(table, expected):
+    pd.testing.assert_frame_equal(table.reset_index(drop=True), expected.reset_index(drop=True)[list(table.columns)],
+                                  check_dtype=False, check_categorical=False)
+
+
+def test_hit_rates_match_loop():
+    df = synthetic_data()
+    static_df, dynamic_df = conf.hit_rates(df)
+    expected = loop_performance(df)
+
+    assert_same_table(static_df, expected[0])
+    assert_same_table(dynamic_df, expected[1])
+
+
+def test_get_performance_matches_loop(monkeypatch):
+    df = synthetic_data(seed=1)
+    monkeypatch.setattr(conf, 'get_data', lambda **kwargs: df[kwargs['columns']] if 'columns' in kwargs else df)
+    tables = conf.get_performance.__wrapped__()
+
+    for table, expected in zip(tables, loop_performance(df)):
+        assert_same_table(table, expected)
+
+
+@pytest.mark.skipif(not os.path.isdir(conf.data_path), reason='no curated data in ' + conf.data_path)
+def test_stored_tables():
+    # Figure 4A, 4C and 4D as anc_MCI_Figure_4.py writes them
+    static_df, dynamic_df, psycho_df = conf.get_performance()
+
+    table_4A = static_df.groupby('size')[['HR', 'chance']].median().reset_index()
+    table_4A['HR'] = np.round(table_4A['HR'], 3)
+    table_4A['chance'] = np.round(table_4A['chance'], 3)
+
+    table_4C = dynamic_df.groupby(['size', 'speed'])['wHR'].mean().reset_index()
+    table_4C['speed'] = table_4C['speed'].astype(int)
+    table_4C['wHR'] = np.round(table_4C['wHR'], 3)
+
+    table_4D = psycho_df.groupby(['speed', 'size']).size().reset_index(name='Count')
+    table_4D['speed'] = table_4D['speed'].astype(int)
+
+    for name, table in [('Figure_4A', table_4A), ('Figure_4C', table_4C), ('Figure_4D', table_4D)]:
+        stored = pd.read_csv("{}{}.csv".format(conf.results_path, name), sep=';', decimal='.')
+        assert_same_table(table, stored)